@@ -1,22 +1,28 @@
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple, Union
 
 from pyrogram import Client
 
+from app.core.executor import purchase_executor
+from app.core.journal import PlanKey, purchase_journal
+from app.core.planner import budget_planner
+from app.core.pool import purchase_pool
 from app.notifications import send_notification
 from app.purchase import buy_gift
-from app.utils.logger import warn, info
+from app.utils.detector import GiftRecord, catalog_cache
+from app.utils.logger import error, warn, info
+from app.utils.tracing import tracer
 from data.config import config, t
 
 
 class GiftProcessor:
     @staticmethod
-    async def evaluate_gift(gift_data: Dict[str, Any]) -> tuple[bool, Dict[str, Any]]:
-        gift_price = gift_data.get("price", 0)
-        is_limited = gift_data.get("is_limited", False)
-        is_sold_out = gift_data.get("is_sold_out", False)
-        is_upgradable = "upgrade_price" in gift_data
-        total_amount = gift_data.get("total_amount", 0) if is_limited else 0
+    async def evaluate_gift(gift: GiftRecord) -> tuple[bool, Dict[str, Any]]:
+        gift_price = gift.price
+        is_limited = gift.is_limited
+        is_sold_out = gift.is_sold_out
+        is_upgradable = gift.upgrade_price is not None
+        total_amount = gift.total_amount if is_limited else 0
 
         exclusion_rules = {
             'sold_out': lambda: is_sold_out,
@@ -41,25 +47,129 @@ class GiftProcessor:
         )
 
 
-async def process_new_gift(app: Client, gift_data: Dict[str, Any]) -> None:
-    gift_id = gift_data.get("id")
+async def process_new_gifts(app: Client, gifts: List[GiftRecord],
+                            resumed: Optional[Dict[PlanKey, List[str]]] = None) -> None:
+    eligible = []
 
-    is_eligible, processing_data = await GiftProcessor.evaluate_gift(gift_data)
+    for gift in gifts:
+        with tracer.span('evaluate', gift.id):
+            is_eligible, processing_data = await GiftProcessor.evaluate_gift(gift)
 
-    return await send_notification(app, gift_id, **processing_data) if not is_eligible and processing_data else \
-        await _distribute_gifts(app, gift_id, processing_data.get("quantity", 1), processing_data.get("recipients", []))
+        is_eligible and eligible.extend(_candidates(gift, processing_data["quantity"],
+                                                    processing_data["recipients"], resumed))
+        is_eligible or tracer.finish(gift.id)
+        not is_eligible and processing_data and await send_notification(app, gift.id, **processing_data)
 
+    if not eligible:
+        return
 
-async def _distribute_gifts(app: Client, gift_id: int, quantity: int, recipients: list) -> None:
-    info(t("console.processing_gift", gift_id=gift_id, quantity=quantity, recipients_count=len(recipients)))
+    with tracer.span('plan', *(gift.id for gift, _, _ in eligible)):
+        budget = 0 if purchase_executor.breakers.is_open() else await purchase_pool.ensure_loaded(app)
+        plan = budget_planner.plan(eligible, budget)
 
-    for recipient_id in recipients:
-        try:
-            await buy_gift(app, recipient_id, gift_id, quantity)
-        except Exception as ex:
-            warn(t("console.purchase_error", gift_id=gift_id, chat_id=recipient_id))
-            await send_notification(app, gift_id, error_message=str(ex))
-        await asyncio.sleep(0.5)
+    info(t("console.purchase_plan", gifts=len(eligible), spent=plan.spent, budget=budget))
+    for gift, dropped in plan.dropped:
+        await _report_dropped(app, gift, dropped)
 
+    await asyncio.gather(*(_distribute_planned(app, gift, allocation, resumed)
+                           for gift, allocation in plan.allocations))
 
-process_gift = process_new_gift
+
+def _candidates(gift: GiftRecord, quantity: int, recipients: List[Union[int, str]],
+                resumed: Optional[Dict[PlanKey, List[str]]]) -> List[Tuple[GiftRecord, int, List[Union[int, str]]]]:
+    if resumed is None:
+        return [(gift, quantity, recipients)]
+
+    return [
+        (gift, min(quantity, len(resumed[gift.id, recipient])), [recipient])
+        for recipient in recipients if resumed.get((gift.id, recipient))
+    ]
+
+
+async def _distribute_planned(app: Client, gift: GiftRecord, allocation: Dict[Union[int, str], int],
+                              resumed: Optional[Dict[PlanKey, List[str]]] = None) -> None:
+    try:
+        allocation and await _distribute_gifts(app, gift, allocation, resumed)
+    finally:
+        tracer.finish(gift.id)
+
+
+async def _report_dropped(app: Client, gift: GiftRecord, dropped: Dict[Union[int, str], int]) -> None:
+    units = sum(dropped.values())
+    recipients = ", ".join(f"{recipient} x{count}" for recipient, count in dropped.items())
+    warn(t("console.budget_dropped", gift_id=gift.id, units=units, cost=units * gift.price, recipients=recipients))
+    await send_notification(app, gift.id, budget_dropped=True, units=units, gift_price=units * gift.price,
+                            recipients=recipients)
+
+
+async def _distribute_gifts(app: Client, gift: GiftRecord, allocation: Dict[Union[int, str], int],
+                            resumed: Optional[Dict[PlanKey, List[str]]] = None) -> None:
+    recipients = list(allocation)
+    info(t("console.processing_gift", gift_id=gift.id, quantity=max(allocation.values()),
+           recipients_count=len(recipients)))
+
+    results = await asyncio.gather(
+        *(buy_gift(app, recipient_id, gift, quantity, _take_jobs(resumed, gift.id, recipient_id, quantity))
+          for recipient_id, quantity in allocation.items()),
+        return_exceptions=True
+    )
+
+    for recipient_id, result in zip(recipients, results):
+        if isinstance(result, Exception):
+            warn(t("console.purchase_error", gift_id=gift.id, chat_id=recipient_id))
+            await send_notification(app, gift.id, error_message=str(result))
+
+
+def _take_jobs(resumed: Optional[Dict[PlanKey, List[str]]], gift_id: int, chat_id: Union[int, str],
+               quantity: int) -> Optional[List[str]]:
+    if resumed is None:
+        return None
+
+    job_ids = resumed.get((gift_id, chat_id), [])
+    taken = job_ids[:quantity]
+    del job_ids[:quantity]
+    return taken
+
+
+async def recover_purchases() -> Dict[PlanKey, List[str]]:
+    try:
+        planned, unconfirmed = await purchase_journal.recover()
+    except OSError as ex:
+        error(t("console.journal_resume_error", error=str(ex)))
+        return {}
+
+    for entry in unconfirmed:
+        warn(t("console.journal_unconfirmed", gift_id=entry['gift_id'], chat_id=entry['chat_id'], job=entry['job'],
+               path=purchase_journal.unconfirmed_path))
+    return planned
+
+
+async def resume_purchases(app: Client, planned: Dict[PlanKey, List[str]]) -> None:
+    gifts = {gift_id: await _lookup_gift(app, gift_id) for gift_id, _ in planned}
+    for (gift_id, chat_id), job_ids in planned.items():
+        gifts[gift_id] and info(t("console.journal_resumed", count=len(job_ids), gift_id=gift_id, chat_id=chat_id))
+        gifts[gift_id] or warn(t("console.journal_gift_missing", count=len(job_ids), gift_id=gift_id,
+                                 chat_id=chat_id))
+
+    resumed = {key: list(job_ids) for key, job_ids in planned.items() if gifts[key[0]]}
+    try:
+        resumed and await process_new_gifts(app, [gift for gift in gifts.values() if gift], resumed)
+    except Exception as ex:
+        error(t("console.journal_resume_error", error=str(ex)))
+
+    for (gift_id, chat_id), job_ids in planned.items():
+        skipped = resumed.get((gift_id, chat_id), job_ids)
+        gifts[gift_id] and skipped and warn(t("console.journal_dropped", count=len(skipped), gift_id=gift_id,
+                                              chat_id=chat_id))
+        for job in skipped:
+            purchase_journal.record(job, 'skip')
+
+
+async def _lookup_gift(app: Client, gift_id: int) -> Optional[GiftRecord]:
+    try:
+        return await catalog_cache.get(app, gift_id)
+    except Exception:
+        return None
+
+
+process_gifts = process_new_gifts
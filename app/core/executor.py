@@ -0,0 +1,135 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from app.utils.detector import GiftRecord
+from app.utils.logger import warn
+from data.config import config, t
+
+PurchaseKey = Tuple[int, Union[int, str]]
+
+
+class CircuitBreakers:
+    """Open circuits that stop purchases before they cost an RPC."""
+
+    def __init__(self, cooldown: float) -> None:
+        self.cooldown = cooldown
+        self.gifts: Set[int] = set()
+        self.recipients: Dict[Union[int, str], float] = {}
+        self.balance_until = 0.0
+
+    def is_open(self, gift_id: Optional[int] = None, chat_id: Union[int, str, None] = None) -> bool:
+        now = time.monotonic()
+        return (now < self.balance_until or gift_id in self.gifts
+                or now < self.recipients.get(chat_id, 0.0))
+
+    def trip(self, kind: str, gift_id: int, chat_id: Union[int, str]) -> bool:
+        was_open = self.is_open(gift_id if kind == 'sold_out' else None, chat_id if kind == 'invalid_peer' else None)
+        until = time.monotonic() + self.cooldown
+
+        breakers = {
+            'sold_out': lambda: self.gifts.add(gift_id),
+            'low_balance': lambda: setattr(self, 'balance_until', until),
+            'invalid_peer': lambda: self.recipients.update({chat_id: until})
+        }
+        kind in breakers and breakers[kind]()
+        return kind in breakers and not was_open
+
+
+class PurchaseExecutor:
+    """Runs gift sends as tasks, at most MAX_CONCURRENT_PURCHASES at once, best job first."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.running = 0
+        self.breakers = CircuitBreakers(config.BREAKER_COOLDOWN)
+        self._tasks: Dict[PurchaseKey, Set[asyncio.Task]] = {}
+        self._waiting: List[Tuple[tuple, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    @staticmethod
+    def job_priority(gift: Optional[GiftRecord], unit: int) -> tuple:
+        if gift is None:
+            return float('inf'), 0, len(config.GIFT_RANGES), unit
+
+        total_amount = gift.total_amount if gift.is_limited else 0
+        position = config.GIFT_RANGE_INDEX.position(gift.price, total_amount)
+        return (total_amount if gift.is_limited else float('inf'), -gift.price,
+                len(config.GIFT_RANGES) if position is None else position, unit)
+
+    @asynccontextmanager
+    async def slot(self, priority: tuple) -> AsyncIterator[None]:
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def submit(self, gift_id: int, chat_id: int, factory: Callable[[], Awaitable]) -> Optional[asyncio.Task]:
+        if self.breakers.is_open(gift_id, chat_id):
+            return None
+
+        key = (gift_id, chat_id)
+        task = asyncio.create_task(factory())
+        tasks = self._tasks.setdefault(key, set())
+        tasks.add(task)
+        task.add_done_callback(lambda done: self._discard(key, done))
+        return task
+
+    def cancel(self, gift_id: Optional[int] = None, chat_id: Union[int, str, None] = None) -> int:
+        current_task = asyncio.current_task()
+        pending = [
+            task for (task_gift_id, task_chat_id), tasks in self._tasks.items()
+            if gift_id in (None, task_gift_id) and chat_id in (None, task_chat_id)
+            for task in tasks
+            if task is not current_task and not task.done()
+        ]
+
+        for task in pending:
+            task.cancel()
+        return len(pending)
+
+    def trip(self, kind: str, gift_id: int, chat_id: Union[int, str]) -> None:
+        if not self.breakers.trip(kind, gift_id, chat_id):
+            return
+
+        cancellations = {
+            'sold_out': lambda: self.cancel(gift_id),
+            'low_balance': lambda: self.cancel(),
+            'invalid_peer': lambda: self.cancel(chat_id=chat_id)
+        }
+        cancelled = cancellations[kind]()
+        warn(t(f"console.breaker_{kind}", gift_id=gift_id, chat_id=chat_id, count=cancelled,
+               cooldown=f"{self.breakers.cooldown:.0f}"))
+
+    async def _acquire(self, priority: tuple) -> None:
+        if self.running < self.limit and not self._waiting:
+            self.running += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            future.done() and not future.cancelled() and self._release()
+            raise
+
+    def _release(self) -> None:
+        while self._waiting:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    def _discard(self, key: PurchaseKey, task: asyncio.Task) -> None:
+        tasks = self._tasks.get(key)
+        tasks is not None and tasks.discard(task)
+        tasks is not None and not tasks and self._tasks.pop(key, None)
+
+
+purchase_executor = PurchaseExecutor(config.MAX_CONCURRENT_PURCHASES)
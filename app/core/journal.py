@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from app.utils.logger import error
+from data.config import config
+
+PlanKey = Tuple[int, Union[int, str]]
+SYNC = getattr(os, 'fdatasync', os.fsync)
+
+
+class PurchaseJournal:
+    """Write-ahead log of gift sends, one JSON line per job transition."""
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self.path = path
+        self._pending: List[str] = []
+        self._waiters: List[asyncio.Future] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._fd: Optional[int] = None
+
+    @property
+    def unconfirmed_path(self) -> Optional[Path]:
+        return self.path and self.path.with_name(self.path.stem + '.unconfirmed.jsonl')
+
+    @staticmethod
+    def new_job() -> str:
+        return uuid.uuid4().hex[:16]
+
+    def record(self, job: str, op: str, **details) -> None:
+        if self.path is None:
+            return
+
+        self._pending.append(json.dumps({'job': job, 'op': op, **details}, ensure_ascii=False))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def start(self, job: str) -> None:
+        if self.path is None:
+            return
+
+        self.record(job, 'start')
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        await waiter
+
+    async def close(self) -> None:
+        self._flush_task and await self._flush_task
+        self._close_file()
+
+    async def recover(self) -> Tuple[Dict[PlanKey, List[str]], List[dict]]:
+        if self.path is None:
+            return {}, []
+        return await asyncio.to_thread(self._recover)
+
+    async def _flush(self) -> None:
+        while self._pending:
+            lines, waiters = self._pending, self._waiters
+            self._pending, self._waiters = [], []
+
+            try:
+                await asyncio.to_thread(self._append, lines)
+            except OSError as ex:
+                error(f'Failed to write purchase journal {self.path}: {str(ex)}')
+
+            for waiter in waiters:
+                waiter.done() or waiter.set_result(None)
+
+    def _append(self, lines: List[str]) -> None:
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self._fd, ("\n".join(lines) + "\n").encode('utf-8'))
+        SYNC(self._fd)
+
+    def _close_file(self) -> None:
+        self._fd is not None and os.close(self._fd)
+        self._fd = None
+
+    def _recover(self) -> Tuple[Dict[PlanKey, List[str]], List[dict]]:
+        jobs: Dict[str, dict] = {}
+
+        try:
+            with self.path.open("r", encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    jobs.setdefault(entry['job'], {}).update(entry)
+        except FileNotFoundError:
+            return {}, []
+
+        planned: Dict[PlanKey, List[str]] = {}
+        unconfirmed = []
+        for job, entry in jobs.items():
+            entry['op'] in ('plan', 'retry') and planned.setdefault((entry['gift_id'], entry['chat_id']), []).append(job)
+            entry['op'] == 'start' and unconfirmed.append(entry)
+
+        unconfirmed and self._write(self.unconfirmed_path, unconfirmed, "a")
+
+        temp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        self._close_file()
+        self._write(temp_path, [{**jobs[job], 'op': 'plan'} for job_ids in planned.values() for job in job_ids])
+        os.replace(temp_path, self.path)
+        return planned, unconfirmed
+
+    @staticmethod
+    def _write(path: Path, entries: List[dict], mode: str = "w") -> None:
+        with path.open(mode, encoding='utf-8') as file:
+            file.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+            file.flush()
+            os.fsync(file.fileno())
+
+
+purchase_journal = PurchaseJournal(config.JOURNAL_FILEPATH if config.PURCHASE_JOURNAL else None)
@@ -0,0 +1,134 @@
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+
+from data.config import config
+
+PURCHASE, NOTIFY, POLL = range(3)
+
+METHOD_PRIORITIES = {
+    'send_gift': PURCHASE,
+    'get_chat': PURCHASE,
+    'GetPaymentForm': PURCHASE,
+    'SendStarsForm': PURCHASE,
+    'send_message': NOTIFY,
+    'get_stars_balance': NOTIFY,
+    'GetStarGifts': POLL,
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+
+    def delay(self, needed: float = 1.0) -> float:
+        self._refill()
+        return 0.0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+
+    def ready(self) -> int:
+        self._refill()
+        return max(int(self.tokens), 0)
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class AccountLimiter:
+    """Per-account RPC budget: one token bucket per method, one for the whole account and the FloodWait deadlines.
+
+    Lower-priority calls leave enough account tokens for every higher-priority call already waiting
+    that its own method bucket and FloodWait deadline would let run now.
+    A FloodWait pauses only the method that hit it, except that one on a purchase call also defers
+    notifications until it ends; catalog polling is never held back by another method's wait.
+    """
+
+    def __init__(self) -> None:
+        self.account = TokenBucket(config.ACCOUNT_RATE_LIMIT, max(config.ACCOUNT_RATE_LIMIT, 1.0))
+        self.buckets = {method: TokenBucket(rate, max(rate, 1.0)) for method, rate in config.RATE_LIMITS.items()}
+        self.flood_until: Dict[str, float] = {}
+        self.pressure_until = 0.0
+        self._waiting: Counter = Counter()
+
+    async def acquire(self, method: str, priority: int) -> None:
+        self._waiting[priority, method] += 1
+        try:
+            while (delay := self._delay(method, priority)) > 0:
+                await asyncio.sleep(delay)
+        finally:
+            self._waiting[priority, method] -= 1
+
+        self.account.take()
+        method in self.buckets and self.buckets[method].take()
+
+    def record_flood_wait(self, method: str, seconds: float) -> None:
+        deadline = time.monotonic() + seconds
+        self.flood_until[method] = max(self.flood_until.get(method, 0.0), deadline)
+        if METHOD_PRIORITIES.get(method, NOTIFY) == PURCHASE:
+            self.pressure_until = max(self.pressure_until, deadline)
+
+    def _delay(self, method: str, priority: int) -> float:
+        now = time.monotonic()
+        reserved = sum(self._runnable(waiting_method, waiting_priority, count, now)
+                       for (waiting_priority, waiting_method), count in self._waiting.items()
+                       if waiting_priority < priority)
+        bucket = self.buckets.get(method)
+
+        return max(
+            self.flood_until.get(method, 0.0) - now,
+            self.pressure_until - now if priority == NOTIFY else 0.0,
+            self.account.delay(1.0 + reserved),
+            bucket.delay() if bucket else 0.0
+        )
+
+    def _runnable(self, method: str, priority: int, count: int, now: float) -> int:
+        if self.flood_until.get(method, 0.0) > now or priority == NOTIFY and self.pressure_until > now:
+            return 0
+
+        bucket = self.buckets.get(method)
+        return count if bucket is None else min(count, bucket.ready())
+
+
+class RateLimitedClient:
+    """Pyrogram client proxy that routes every known RPC through the account's AccountLimiter."""
+
+    def __init__(self, client: Client, limiter: Optional[AccountLimiter] = None) -> None:
+        self.client = client
+        self.limiter = limiter or AccountLimiter()
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self.client, name)
+        return self._wrap(name, attribute) if name in METHOD_PRIORITIES else attribute
+
+    async def invoke(self, query, *args, **kwargs) -> Any:
+        method = type(query).__name__
+        return await self._call(method, self.client.invoke, query, *args, **kwargs)
+
+    def _wrap(self, method: str, function):
+        async def limited(*args, **kwargs):
+            return await self._call(method, function, *args, **kwargs)
+
+        return limited
+
+    async def _call(self, method: str, function, *args, **kwargs) -> Any:
+        await self.limiter.acquire(method, METHOD_PRIORITIES.get(method, NOTIFY))
+        try:
+            return await function(*args, **kwargs)
+        except FloodWait as ex:
+            self.limiter.record_flood_wait(method, ex.value)
+            raise
+
+
+rate_limited = RateLimitedClient
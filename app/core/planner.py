@@ -0,0 +1,111 @@
+import math
+import operator
+from typing import Dict, List, NamedTuple, Tuple, Union
+
+from app.utils.detector import GiftRecord
+from data.config import config
+
+Recipient = Union[int, str]
+
+PLAN_VALUES = {
+    'scarcity': lambda gift: 1.0 / max(gift.total_amount, 1),
+    'units': lambda gift: 1.0,
+    'stars': lambda gift: float(gift.price),
+}
+
+
+class PurchasePlan(NamedTuple):
+    allocations: List[Tuple[GiftRecord, Dict[Recipient, int]]]
+    dropped: List[Tuple[GiftRecord, Dict[Recipient, int]]]
+    spent: int
+
+
+class BudgetPlanner:
+    """Splits the balance across all new gifts at once: a bounded knapsack over (gift, unit) with PURCHASE_VALUE.
+
+    Prices are bucketed so the table never exceeds RESOLUTION columns. Buckets round prices up, so the
+    plan never overspends; stars left over by the rounding are then filled greedily by value per star.
+    A limited gift is never planned for more units than it has left.
+    """
+
+    RESOLUTION = 1000
+
+    def plan(self, candidates: List[Tuple[GiftRecord, int, List[Recipient]]], budget: float) -> PurchasePlan:
+        value = PLAN_VALUES.get(config.PURCHASE_VALUE, PLAN_VALUES['scarcity'])
+        requested = [self._requested(gift, quantity * len(recipients)) for gift, quantity, recipients in candidates]
+        units = self._solve([int(gift.price) for gift, _, _ in candidates],
+                            [value(gift) for gift, _, _ in candidates], requested, max(int(budget), 0))
+
+        allocations, dropped = [], []
+        for (gift, quantity, recipients), count, wanted in zip(candidates, units, requested):
+            allocation = self._allocate(count, quantity, recipients)
+            available = self._allocate(wanted, quantity, recipients)
+            allocations.append((gift, allocation))
+            count < wanted and dropped.append((gift, {
+                recipient: units - allocation.get(recipient, 0)
+                for recipient, units in available.items() if allocation.get(recipient, 0) < units
+            }))
+
+        spent = sum(gift.price * count for (gift, _, _), count in zip(candidates, units))
+        return PurchasePlan(allocations, dropped, spent)
+
+    def _solve(self, prices: List[int], values: List[float], counts: List[int], budget: int) -> List[int]:
+        if sum(price * count for price, count in zip(prices, counts)) <= budget:
+            return list(counts)
+
+        divisor = math.gcd(*prices) or 1
+        step = divisor if budget // divisor <= self.RESOLUTION else math.ceil(budget / self.RESOLUTION)
+        capacity = budget // step
+        pieces = [
+            (index, size, -(-prices[index] // step) * size, values[index] * size)
+            for index, count in enumerate(counts)
+            for size in self._split(count)
+        ]
+
+        best, choices = [0.0] * (capacity + 1), []
+        for _, _, weight, piece_value in pieces:
+            if weight > capacity:
+                choices.append(None)
+                continue
+            shifted = [total + piece_value for total in best[:capacity + 1 - weight]]
+            choices.append(list(map(operator.gt, shifted, best[weight:])))
+            best[weight:] = map(max, best[weight:], shifted)
+
+        units, remaining = [0] * len(counts), capacity
+        for (index, size, weight, _), improved in zip(reversed(pieces), reversed(choices)):
+            if improved and remaining >= weight and improved[remaining - weight]:
+                units[index] += size
+                remaining -= weight
+
+        leftover = budget - sum(price * count for price, count in zip(prices, units))
+        for index in sorted(range(len(counts)), key=lambda i: values[i] / max(prices[i], 1), reverse=True):
+            extra = min(counts[index] - units[index], leftover // prices[index] if prices[index] else counts[index])
+            units[index] += extra
+            leftover -= extra * prices[index]
+
+        return units
+
+    @staticmethod
+    def _requested(gift: GiftRecord, units: int) -> int:
+        return units if gift.remaining is None else min(units, max(gift.remaining, 0))
+
+    @staticmethod
+    def _split(count: int) -> List[int]:
+        sizes, size = [], 1
+        while count > 0:
+            sizes.append(min(size, count))
+            count -= size
+            size *= 2
+        return sizes
+
+    @staticmethod
+    def _allocate(units: int, quantity: int, recipients: List[Recipient]) -> Dict[Recipient, int]:
+        allocation = {}
+        for recipient in recipients:
+            take = min(quantity, units)
+            take and allocation.update({recipient: take})
+            units -= take
+        return allocation
+
+
+budget_planner = BudgetPlanner()
@@ -0,0 +1,94 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pyrogram import Client
+
+from app.utils.helper import get_balance_ledger, prewarm_recipients
+from data.config import config
+
+
+class PurchasePool:
+    """Accounts that can send gifts; each unit goes to the account with the most spare stars not in a FloodWait.
+
+    An account the server rejected with BALANCE_TOO_LOW is left out of units at that price or more for
+    BREAKER_COOLDOWN seconds, or until a later balance read shows it can pay that price again;
+    can_pay tells whether any other account still has the stars for a unit, reserved ones included.
+    """
+
+    def __init__(self) -> None:
+        self.clients: List[Client] = []
+        self._flood_until: Dict[str, float] = {}
+        self._drained: Dict[str, Tuple[float, int, float]] = {}
+
+    def register(self, *clients: Client) -> None:
+        for client in clients:
+            client in self.clients or self.clients.append(client)
+
+    def members(self, app: Client) -> List[Client]:
+        return self.clients or [app]
+
+    async def prepare(self, app: Client) -> None:
+        members = self.members(app)
+        await asyncio.gather(*(get_balance_ledger(client).refresh(client) for client in members),
+                             *(prewarm_recipients(client, channel=client is app) for client in members))
+
+    async def ensure_loaded(self, app: Client) -> int:
+        members = self.members(app)
+        balances = await asyncio.gather(*(get_balance_ledger(client).ensure_loaded(client) for client in members))
+        return sum(balance for client, balance in zip(members, balances) if not self.is_drained(client))
+
+    def is_flood_waiting(self, client: Client) -> bool:
+        return time.monotonic() < self._flood_until.get(client.name, 0.0)
+
+    def mark_flood_wait(self, client: Client, seconds: float) -> None:
+        self._flood_until[client.name] = time.monotonic() + seconds
+
+    def is_drained(self, client: Client, price: Optional[int] = None) -> bool:
+        until, rejected_price, drained_at = self._drained.get(client.name, (0.0, 0, 0.0))
+        ledger = get_balance_ledger(client)
+        paid_up = ledger.synced_at > drained_at and ledger.available + ledger.reserved >= rejected_price
+        return time.monotonic() < until and (price is None or price >= rejected_price) and not paid_up
+
+    def mark_drained(self, client: Client, price: int) -> None:
+        now = time.monotonic()
+        self._drained[client.name] = now + config.BREAKER_COOLDOWN, price, now
+
+    def can_pay(self, app: Client, price: int) -> bool:
+        return any(
+            not self.is_drained(client, price) and (ledger := get_balance_ledger(client)).available + ledger.reserved >= price
+            for client in self.members(app)
+        )
+
+    def reserve(self, app: Client, price: int, quantity: int) -> List[Client]:
+        assigned = []
+
+        for _ in range(quantity):
+            client = self._pick(app, price)
+            if client is None:
+                break
+            get_balance_ledger(client).reserve(price, 1)
+            assigned.append(client)
+
+        return assigned
+
+    def reassign(self, app: Client, client: Client, price: int, ready_only: bool = True) -> Optional[Client]:
+        other = self._pick(app, price, exclude=client)
+        if other is None or ready_only and self.is_flood_waiting(other):
+            return None
+
+        get_balance_ledger(client).release(price)
+        get_balance_ledger(other).reserve(price, 1)
+        return other
+
+    def _pick(self, app: Client, price: int, exclude: Client = None) -> Optional[Client]:
+        candidates = [
+            client for client in self.members(app)
+            if client is not exclude and not self.is_drained(client, price)
+            and get_balance_ledger(client).available >= price
+        ]
+        ready = [client for client in candidates if not self.is_flood_waiting(client)] or candidates
+        return max(ready, key=lambda client: get_balance_ledger(client).available, default=None)
+
+
+purchase_pool = PurchasePool()
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Union
+
+from pyrogram import Client, raw
+from pyrogram.errors import BalanceTooLow, StargiftUsageLimited
+
+from app.core.journal import purchase_journal
+from app.utils.detector import GiftRecord, MemoryHistoryStore, catalog_cache, create_history_store
+from app.utils.logger import info
+from app.utils.tracing import tracer
+from data.config import t
+
+
+class RecordedCatalog:
+    """Saved history.json snapshots served as GetStarGifts results, advancing one snapshot every `step` seconds."""
+
+    def __init__(self, paths: List[Path], step: float) -> None:
+        self.snapshots = [self.load(path) for path in self.collect(paths)]
+        if not self.snapshots:
+            raise ValueError(f"No catalog snapshots found in {', '.join(map(str, paths))}")
+        self.step = step
+        self._started: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        return self.step * max(len(self.snapshots) - 1, 0)
+
+    @staticmethod
+    def collect(paths: List[Path]) -> List[Path]:
+        return [
+            snapshot
+            for path in paths
+            for snapshot in (sorted(path.glob('*.json')) if path.is_dir() else [path])
+        ]
+
+    @staticmethod
+    def load(path: Path) -> List[GiftRecord]:
+        with path.open("r", encoding='utf-8') as file:
+            return [GiftRecord.from_dict(gift) for gift in json.load(file)]
+
+    def seed(self) -> Dict[int, str]:
+        return {gift.id: gift.content_hash for gift in self.snapshots[0]}
+
+    def star_gifts(self, known_hash: int) -> Union[raw.types.payments.StarGifts,
+                                                   raw.types.payments.StarGiftsNotModified]:
+        self._started = self._started or time.monotonic()
+        index = min(int((time.monotonic() - self._started) / self.step) if self.step else len(self.snapshots),
+                    len(self.snapshots) - 1)
+
+        if index + 1 == known_hash:
+            return raw.types.payments.StarGiftsNotModified()
+
+        gifts = [
+            raw.types.StarGift(
+                id=gift.id, sticker=None, stars=gift.price, convert_stars=gift.price,
+                limited=gift.is_limited or None, sold_out=gift.is_sold_out or None,
+                availability_total=gift.total_amount or None, availability_remains=gift.availability_remains,
+                upgrade_stars=gift.upgrade_price
+            )
+            for gift in self.snapshots[index]
+        ]
+        return raw.types.payments.StarGifts(hash=index + 1, gifts=gifts, chats=[], users=[])
+
+
+class SimulatedClient:
+    """Pyrogram client proxy for --simulate: payments and sends are stubbed against a virtual balance.
+
+    Recipient lookups still reach Telegram, and so does the catalog unless a RecordedCatalog is given.
+    Messages are dropped. Stubbed sends are priced from the shared catalog_cache, whichever session polled it,
+    and each is recorded with the time from the gift's detection.
+    """
+
+    def __init__(self, client: Client, balance: Optional[int], latency: float = 0.0,
+                 catalog: Optional[RecordedCatalog] = None) -> None:
+        self.client = client
+        self.balance = balance
+        self.latency = latency
+        self.catalog = catalog
+        self.purchases: List[dict] = []
+        self._forms = itertools.count(1)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.client, name)
+
+    async def invoke(self, query, *args, **kwargs) -> Any:
+        if isinstance(query, raw.functions.payments.GetStarGifts) and self.catalog:
+            return self.catalog.star_gifts(query.hash)
+
+        if isinstance(query, raw.functions.payments.GetPaymentForm):
+            await asyncio.sleep(self.latency)
+            return SimpleNamespace(form_id=next(self._forms))
+
+        if isinstance(query, raw.functions.payments.SendStarsForm):
+            return await self._purchase(query.invoice.peer, query.invoice.gift_id)
+
+        return await self.client.invoke(query, *args, **kwargs)
+
+    async def resolve_peer(self, peer_id: Union[int, str]) -> Union[int, str]:
+        return peer_id
+
+    async def send_gift(self, chat_id: Union[int, str], gift_id: int, **kwargs) -> None:
+        await self._purchase(chat_id, gift_id)
+
+    async def get_stars_balance(self, *args, **kwargs) -> int:
+        if self.balance is None:
+            self.balance = await self.client.get_stars_balance(*args, **kwargs)
+        return self.balance
+
+    async def send_message(self, *args, **kwargs) -> None:
+        return None
+
+    async def _purchase(self, chat_id: Union[int, str], gift_id: int) -> None:
+        await asyncio.sleep(self.latency)
+        gift = catalog_cache.gifts.get(gift_id)
+        price = gift.price if gift else 0
+
+        if gift and gift.is_sold_out:
+            raise StargiftUsageLimited()
+        if price > await self.get_stars_balance():
+            raise BalanceTooLow()
+
+        timeline = tracer.timelines.get(gift_id)
+        self.balance -= price
+        self.purchases.append({
+            'gift_id': gift_id, 'chat_id': chat_id, 'price': price, 'sent_at': time.perf_counter(),
+            'decision_ms': (time.perf_counter() - timeline.anchor) * 1000 if timeline else None
+        })
+
+
+class Simulation:
+    """Dry run of the buyer: every purchasing account is a SimulatedClient and nothing is persisted.
+
+    Gift history is only read, without creating or migrating the database.
+    """
+
+    def __init__(self, balance: Optional[int], latency: float, catalog: Optional[RecordedCatalog] = None) -> None:
+        self.balance = balance
+        self.latency = latency
+        self.catalog = catalog
+        self.clients: List[SimulatedClient] = []
+        self.starting_balance = 0
+
+    def wrap(self, client: Client, catalog: bool = False) -> SimulatedClient:
+        simulated = SimulatedClient(client, self.balance, self.latency, self.catalog if catalog else None)
+        self.clients.append(simulated)
+        return simulated
+
+    def history_store(self, from_empty: bool) -> MemoryHistoryStore:
+        if from_empty:
+            return MemoryHistoryStore({})
+        return MemoryHistoryStore(self.catalog.seed() if self.catalog else create_history_store().peek())
+
+    async def start(self) -> None:
+        purchase_journal.path = None
+        tracer.path = None
+
+        balances = await asyncio.gather(*(client.get_stars_balance() for client in self.clients))
+        self.starting_balance = sum(balances)
+        info(t("console.simulation_started", accounts=len(self.clients), balance=self.starting_balance))
+
+    def report(self) -> None:
+        purchases = sorted((purchase for client in self.clients for purchase in client.purchases),
+                           key=lambda purchase: purchase['sent_at'])
+        grouped = defaultdict(list)
+        for purchase in purchases:
+            grouped[purchase['gift_id'], purchase['chat_id']].append(purchase)
+
+        for (gift_id, chat_id), units in grouped.items():
+            decisions = [unit['decision_ms'] for unit in units if unit['decision_ms'] is not None]
+            info(t("console.simulation_purchase", gift_id=gift_id, count=len(units), recipient=chat_id,
+                   stars=sum(unit['price'] for unit in units),
+                   first=f"{min(decisions):.0f}" if decisions else "-",
+                   last=f"{max(decisions):.0f}" if decisions else "-"))
+
+        decisions = sorted(purchase['decision_ms'] for purchase in purchases if purchase['decision_ms'] is not None)
+        duration = purchases[-1]['sent_at'] - purchases[0]['sent_at'] if len(purchases) > 1 else 0.0
+        spent = sum(purchase['price'] for purchase in purchases)
+
+        info(t("console.simulation_summary", purchases=len(purchases), gifts=len({gift_id for gift_id, _ in grouped}),
+               spent=spent, balance=self.starting_balance, remaining=self.starting_balance - spent,
+               p50=f"{decisions[len(decisions) // 2]:.0f}" if decisions else "-",
+               max=f"{decisions[-1]:.0f}" if decisions else "-",
+               rate=f"{(len(purchases) - 1) / duration:.1f}" if duration else "-"))
@@ -8,22 +8,34 @@ from app.utils.logger import error
 from data.config import t
 
 
+ERROR_KINDS = {
+    'STARGIFT_USAGE_LIMITED': 'sold_out',
+    'BALANCE_TOO_LOW': 'low_balance',
+    'PEER_ID_INVALID': 'invalid_peer'
+}
+
+
 class ErrorHandler:
+    @staticmethod
+    def classify_error(ex: RPCError) -> str:
+        error_id = getattr(ex, 'ID', None) or next((key for key in ERROR_KINDS if key in str(ex)), None)
+        return ERROR_KINDS.get(error_id, 'other')
+
     @staticmethod
     def get_error_handlers() -> Dict[str, Dict[str, Any]]:
         return {
             'BALANCE_TOO_LOW': {
-                'check': lambda e: 'BALANCE_TOO_LOW' in str(e),
+                'check': lambda e: ErrorHandler.classify_error(e) == 'low_balance',
                 'log_message': 'low_balance',
                 'notification_key': 'balance_error'
             },
             'STARGIFT_USAGE_LIMITED': {
-                'check': lambda e: 'STARGIFT_USAGE_LIMITED' in str(e),
+                'check': lambda e: ErrorHandler.classify_error(e) == 'sold_out',
                 'log_message': None,
                 'notification_key': 'sold_out'
             },
             'PEER_ID_INVALID': {
-                'check': lambda e: 'PEER_ID_INVALID' in str(e),
+                'check': lambda e: ErrorHandler.classify_error(e) == 'invalid_peer',
                 'log_message': t("console.peer_id"),
                 'notification_key': 'peer_id_error'
             }
@@ -61,4 +73,5 @@ class ErrorHandler:
             app, gift_id, **notification_data[notification_key])
 
 
+classify_error = ErrorHandler.classify_error
 handle_gift_error = ErrorHandler.handle_gift_error
@@ -1,21 +1,123 @@
+import asyncio
+import time
+from collections import Counter
+from typing import List, NamedTuple, Optional, Tuple
+
 from pyrogram import Client
-from pyrogram.errors import RPCError
+from pyrogram.errors import FloodWait, RPCError
 
-from app.utils.helper import get_user_balance, format_user_reference
-from app.utils.logger import error
+from app.utils.helper import get_balance_ledger, format_user_reference
+from app.utils.logger import error, warn
 from data.config import config, t
 
 
-class NotificationManager:
-    @staticmethod
-    async def send_message(app: Client, message: str) -> None:
-        if not config.CHANNEL_ID:
+class Notification(NamedTuple):
+    app: Client
+    message: str
+    gift_id: Optional[int] = None
+    recipient: Optional[Tuple[int, str]] = None
+
+
+class NotificationDispatcher:
+    """Bounded queue drained by one background task that posts to the channel at NOTIFICATION_INTERVAL.
+
+    Success messages for the same gift that pile up while waiting are merged into one digest.
+    """
+
+    def __init__(self, max_size: int, interval: float) -> None:
+        self.max_size = max_size
+        self.interval = interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._next_post_at = 0.0
+
+    def submit(self, notification: Notification) -> None:
+        self._worker is None and self._start()
+        try:
+            self._queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            warn(f'Notification queue is full, dropping message for gift {notification.gift_id}')
+
+    async def close(self, timeout: float = None) -> None:
+        if self._worker is None:
             return
 
         try:
-            await app.send_message(config.CHANNEL_ID, message, disable_web_page_preview=True)
-        except RPCError as ex:
-            error(f'Failed to send message to channel {config.CHANNEL_ID}: {str(ex)}')
+            await asyncio.wait_for(self._queue.join(), timeout or config.NOTIFICATION_FLUSH_TIMEOUT)
+        except asyncio.TimeoutError:
+            warn(f'Dropped {self._queue.qsize()} unsent notifications on shutdown')
+        finally:
+            self._worker.cancel()
+            self._worker = None
+
+    def _start(self) -> None:
+        self._queue = asyncio.Queue(self.max_size)
+        self._worker = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            await self._wait_for_slot()
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                for app, message in self._merge(batch):
+                    await self._wait_for_slot()
+                    await self._post(app, message)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _wait_for_slot(self) -> None:
+        delay = self._next_post_at - time.monotonic()
+        delay > 0 and await asyncio.sleep(delay)
+
+    @staticmethod
+    def _merge(batch: List[Notification]) -> List[Tuple[Client, str]]:
+        digests = {}
+        for notification in batch:
+            notification.recipient and digests.setdefault(notification.gift_id, []).append(notification)
+
+        messages = []
+        for notification in batch:
+            group = digests.get(notification.gift_id) if notification.recipient else None
+            if group is None:
+                messages.append((notification.app, notification.message))
+            elif group[0] is notification:
+                messages.append((notification.app, NotificationDispatcher._format_digest(group)))
+
+        return messages
+
+    @staticmethod
+    def _format_digest(group: List[Notification]) -> str:
+        recipient_counts = Counter(notification.recipient for notification in group)
+        return group[0].message if len(group) == 1 else t(
+            "telegram.success_digest", gift_id=group[0].gift_id, count=len(group),
+            recipients="\n".join(f"{format_user_reference(*recipient)} x{count}"
+                                 for recipient, count in recipient_counts.items()))
+
+    async def _post(self, app: Client, message: str) -> None:
+        for _ in range(2):
+            try:
+                await app.send_message(config.CHANNEL_ID, message, disable_web_page_preview=True)
+                break
+            except FloodWait as ex:
+                warn(f'Channel flood limit hit, waiting {ex.value}s')
+                await asyncio.sleep(ex.value)
+            except RPCError as ex:
+                error(f'Failed to send message to channel {config.CHANNEL_ID}: {str(ex)}')
+                break
+            except Exception as ex:
+                error(f'Failed to send notification: {str(ex)}')
+                break
+        self._next_post_at = time.monotonic() + self.interval
+
+
+class NotificationManager:
+    @staticmethod
+    async def send_message(app: Client, message: str) -> None:
+        config.CHANNEL_ID and notification_dispatcher.submit(Notification(app, message))
 
     @staticmethod
     async def send_notification(app: Client, gift_id: int, **kwargs) -> None:
@@ -40,23 +142,25 @@ class NotificationManager:
                                           purchased=kwargs.get('purchased', 0),
                                           requested=kwargs.get('requested', 0),
                                           remaining_cost=kwargs.get('remaining_cost', 0),
-                                          current_balance=kwargs.get('current_balance', 0))
+                                          current_balance=kwargs.get('current_balance', 0)),
+            'budget_dropped': lambda: t("telegram.budget_dropped", gift_id=gift_id,
+                                        units=kwargs.get('units', 0),
+                                        gift_price=kwargs.get('gift_price', 0),
+                                        recipients=kwargs.get('recipients', ''))
         }
 
         for key, value in kwargs.items():
-            value and key in message_types and await NotificationManager._send_with_error_handling(
-                app, message_types[key]().strip())
+            value and key in message_types and NotificationManager._submit(
+                app, gift_id, key, message_types[key]().strip(), kwargs)
 
     @staticmethod
-    async def _send_with_error_handling(app: Client, message: str) -> None:
-        try:
-            await NotificationManager.send_message(app, message)
-        except RPCError as ex:
-            error(f'Failed to send notification: {str(ex)}')
+    def _submit(app: Client, gift_id: int, key: str, message: str, kwargs: dict) -> None:
+        recipient = (kwargs.get('user_id'), kwargs.get('username')) if key == 'success_message' else None
+        config.CHANNEL_ID and notification_dispatcher.submit(Notification(app, message, gift_id, recipient))
 
     @staticmethod
     async def send_start_message(client: Client) -> None:
-        balance = await get_user_balance(client)
+        balance = await get_balance_ledger(client).ensure_loaded(client)
         ranges_text = "\n".join([
             f"• {r['min_price']}-{r['max_price']} ⭐ (supply ≤ {r['supply_limit']}) x{r['quantity']} -> {len(r['recipients'])} recipients"
             for r in config.GIFT_RANGES
@@ -89,6 +193,7 @@ class NotificationManager:
             app, t("telegram.skip_summary_header") + "\n" + "\n".join(summary_parts))
 
 
+notification_dispatcher = NotificationDispatcher(config.NOTIFICATION_QUEUE_SIZE, config.NOTIFICATION_INTERVAL)
 send_message = NotificationManager.send_message
 send_notification = NotificationManager.send_notification
 send_start_message = NotificationManager.send_start_message
@@ -1,55 +1,287 @@
-from pyrogram import Client
-from pyrogram.errors import RPCError
+from __future__ import annotations
 
-from app.errors import handle_gift_error
+import asyncio
+import heapq
+import itertools
+from typing import Dict, List, Optional, Tuple, Union
+
+from pyrogram import Client, raw
+from pyrogram.errors import FloodWait, RPCError
+
+from app.core.executor import purchase_executor
+from app.core.journal import purchase_journal
+from app.core.pool import purchase_pool
+from app.errors import classify_error, handle_gift_error
 from app.notifications import send_notification
-from app.utils.helper import get_recipient_info, get_user_balance
+from app.utils.detector import GiftRecord
+from app.utils.helper import get_balance_ledger, get_recipient_info
 from app.utils.logger import info, warn
-from data.config import t
+from app.utils.tracing import tracer
+from data.config import config, t
+
+
+class UnitReservation:
+    __slots__ = ('client', 'settled', 'job', 'started')
+
+    def __init__(self, client: Client, job: str) -> None:
+        self.client = client
+        self.settled = False
+        self.job = job
+        self.started = False
+
+
+class PaymentForms:
+    """Star gift invoices and payment forms fetched ahead of the sends.
+
+    With a form in hand a unit costs a single SendStarsForm round trip. Forms are treated as single-use.
+    They are fetched for the best waiting units by job_priority, at most one executor window across
+    every account, recipient and gift, so prefetching never crowds out the sends it is meant to speed up.
+    Pyrogram builds without the star gift payment types, and form errors, fall back to send_gift.
+    """
+
+    FALLBACK_ERRORS = {'FORM_EXPIRED', 'FORM_ID_EXPIRED', 'FORM_ID_INVALID', 'FORM_UNSUPPORTED'}
+    SUPPORTED = (all(hasattr(raw.functions.payments, name) for name in ('GetPaymentForm', 'SendStarsForm'))
+                 and hasattr(raw.types, 'InputInvoiceStarGift'))
+
+    def __init__(self) -> None:
+        self._targets: Dict[str, Tuple[Client, Union[int, str], int]] = {}
+        self._forms: Dict[str, asyncio.Task] = {}
+        self._wanted: List[Tuple[tuple, int, str]] = []
+        self._sequence = itertools.count()
+
+    def prepare(self, client: Client, chat_id: Union[int, str], gift_id: int, job: str, priority: tuple) -> None:
+        if not self.SUPPORTED:
+            return
+
+        self._targets[job] = client, chat_id, gift_id
+        heapq.heappush(self._wanted, (priority, next(self._sequence), job))
+        self._refill()
+
+    async def take(self, client: Client, chat_id: Union[int, str], gift_id: int,
+                   job: str) -> Optional[Tuple[int, raw.types.InputInvoiceStarGift]]:
+        if not self.SUPPORTED:
+            return None
+
+        target, prefetched = self._targets.pop(job, None), self._forms.pop(job, None)
+        self._refill()
+        if prefetched is not None and target[0] is not client:
+            prefetched.cancel()
+            prefetched = None
+
+        try:
+            return await (prefetched or self._fetch(client, chat_id, gift_id))
+        except RPCError as ex:
+            if getattr(ex, 'ID', None) in self.FALLBACK_ERRORS:
+                return None
+            raise
+
+    def discard(self, chat_id: Union[int, str], gift_id: int) -> None:
+        for job in [job for job, target in self._targets.items() if target[1:] == (chat_id, gift_id)]:
+            self._targets.pop(job)
+            form = self._forms.pop(job, None)
+            form and form.cancel()
+        self._refill()
+
+    def _refill(self) -> None:
+        while len(self._forms) < purchase_executor.limit and self._wanted:
+            _, _, job = heapq.heappop(self._wanted)
+            if job not in self._targets or job in self._forms:
+                continue
+
+            task = asyncio.create_task(self._fetch(*self._targets[job]))
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._forms[job] = task
+
+    @staticmethod
+    async def _fetch(client: Client, chat_id: Union[int, str],
+                     gift_id: int) -> Tuple[int, raw.types.InputInvoiceStarGift]:
+        with tracer.span('payment_form', gift_id, recipient=chat_id):
+            invoice = raw.types.InputInvoiceStarGift(peer=await client.resolve_peer(chat_id), gift_id=gift_id,
+                                                     hide_name=True)
+            form = await client.invoke(raw.functions.payments.GetPaymentForm(invoice=invoice))
+        return form.form_id, invoice
 
 
 class GiftPurchaser:
     @staticmethod
-    async def buy_gift(app: Client, chat_id: int, gift_id: int, quantity: int = 1) -> None:
-        recipient_info, username = await get_recipient_info(app, chat_id)
-        gift_price = await GiftPurchaser._get_gift_price(app, gift_id)
-        current_balance = await get_user_balance(app)
+    async def buy_gift(app: Client, chat_id: int, gift: GiftRecord, quantity: int = 1,
+                       job_ids: Optional[List[str]] = None) -> None:
+        gift_id, gift_price = gift.id, gift.price
+        job_ids = job_ids or [purchase_journal.new_job() for _ in range(quantity)]
+        if purchase_executor.breakers.is_open(gift_id, chat_id):
+            for job in job_ids:
+                purchase_journal.record(job, 'skip')
+            return
 
-        max_affordable = min(quantity, current_balance // gift_price) if gift_price > 0 else quantity
+        with tracer.span('resolve_recipient', gift_id, recipient=chat_id):
+            recipient_info, username = await get_recipient_info(app, chat_id)
+
+        with tracer.span('price_balance', gift_id, recipient=chat_id):
+            current_balance = await purchase_pool.ensure_loaded(app)
+            reservations = [UnitReservation(client, job) for client, job in
+                            zip(purchase_pool.reserve(app, gift_price, quantity), job_ids)]
+
+        for job in job_ids[len(reservations):]:
+            purchase_journal.record(job, 'skip')
+
+        max_affordable = len(reservations)
 
         max_affordable == 0 and await GiftPurchaser._handle_insufficient_balance(
             app, gift_id, gift_price, current_balance, quantity)
 
-        await GiftPurchaser._purchase_gifts(app, chat_id, gift_id, max_affordable, recipient_info, username)
+        await GiftPurchaser._purchase_gifts(app, chat_id, gift_id, gift, reservations, gift_price,
+                                            recipient_info, username)
 
         max_affordable < quantity and await GiftPurchaser._notify_partial_purchase(
             app, gift_id, quantity, max_affordable, gift_price, current_balance)
 
     @staticmethod
-    async def _get_gift_price(app: Client, gift_id: int) -> int:
+    async def _purchase_gifts(app: Client, chat_id: int, gift_id: int, gift: GiftRecord,
+                              reservations: List[UnitReservation], gift_price: int,
+                              recipient_info: str, username: str) -> None:
+        quantity = len(reservations)
+        for reservation in reservations:
+            purchase_journal.record(reservation.job, 'plan', gift_id=gift_id, chat_id=chat_id)
+        for i, reservation in enumerate(reservations):
+            payment_forms.prepare(reservation.client, chat_id, gift_id, reservation.job,
+                                  purchase_executor.job_priority(gift, i + 1))
+
+        tasks = [
+            purchase_executor.submit(gift_id, chat_id, lambda current_gift=i + 1, reservation=reservation:
+                                     GiftPurchaser._send_gift_unit(app, reservation, chat_id, gift_id, current_gift,
+                                                                   quantity, gift_price, recipient_info, username,
+                                                                   purchase_executor.job_priority(gift, current_gift)))
+            for i, reservation in enumerate(reservations)
+        ]
+        for reservation, task in zip(reservations, tasks):
+            task or purchase_journal.record(reservation.job, 'skip')
+
+        submitted = [(reservation, task) for reservation, task in zip(reservations, tasks) if task]
+        results = await asyncio.gather(*(task for _, task in submitted), return_exceptions=True)
+        payment_forms.discard(chat_id, gift_id)
+
+        failures = [(reservation, result) for (reservation, _), result in zip(submitted, results)
+                    if isinstance(result, Exception)]
+        failures and await GiftPurchaser._report_unit_errors(app, chat_id, gift_id, failures)
+
+        for reservation in reservations:
+            reservation.settled or get_balance_ledger(reservation.client).release(gift_price)
+
+    @staticmethod
+    async def _report_unit_errors(app: Client, chat_id: int, gift_id: int,
+                                  failures: List[Tuple[UnitReservation, Exception]]) -> None:
+        for reservation, ex in failures:
+            warn(t("console.purchase_error", gift_id=gift_id, chat_id=chat_id) + f": {ex!r}")
+            reservation.settled or purchase_journal.record(reservation.job, 'fail', error=type(ex).__name__)
+            reservation.started and get_balance_ledger(reservation.client).schedule_reconcile(reservation.client)
+
+        for message in dict.fromkeys(str(ex) or type(ex).__name__ for _, ex in failures):
+            await send_notification(app, gift_id, error_message=message)
+
+    @staticmethod
+    async def _send_gift_unit(app: Client, reservation: UnitReservation, chat_id: int, gift_id: int,
+                              current_gift: int, quantity: int, gift_price: int,
+                              recipient_info: str, username: str, priority: tuple) -> bool:
         try:
-            gifts = await app.get_available_gifts()
-            return next((gift.price for gift in gifts if gift.id == gift_id), 0)
-        except Exception:
-            return 0
+            sent = await GiftPurchaser._attempt_unit(app, reservation, chat_id, gift_id, current_gift,
+                                                     gift_price, priority)
+        except asyncio.CancelledError:
+            reservation.started or purchase_journal.record(reservation.job, 'cancel')
+            GiftPurchaser._hold_unconfirmed(reservation, gift_price)
+            raise
+
+        if not sent:
+            return False
+
+        info(t("console.gift_sent", current=current_gift, total=quantity,
+               gift_id=gift_id, recipient=recipient_info))
+        with tracer.span('notify', gift_id, recipient=chat_id, unit=current_gift):
+            await send_notification(app, gift_id, user_id=chat_id, username=username,
+                                    current_gift=current_gift, total_gifts=quantity,
+                                    success_message=True)
+        return True
 
     @staticmethod
-    async def _purchase_gifts(app: Client, chat_id: int, gift_id: int, quantity: int,
-                              recipient_info: str, username: str) -> None:
-        for i in range(quantity):
-            current_gift = i + 1
+    def _hold_unconfirmed(reservation: UnitReservation, gift_price: int) -> None:
+        if not reservation.started or reservation.settled:
+            return
+
+        reservation.settled = True
+        get_balance_ledger(reservation.client).hold(
+            reservation.client, gift_price,
+            lambda sent: purchase_journal.record(reservation.job, 'done' if sent else 'cancel', reconciled=True))
+
+    @staticmethod
+    async def _attempt_unit(app: Client, reservation: UnitReservation, chat_id: int, gift_id: int,
+                            current_gift: int, gift_price: int, priority: tuple) -> bool:
+        while True:
+            client = reservation.client
+            ledger = get_balance_ledger(client)
+
             try:
-                await app.send_gift(chat_id=chat_id, gift_id=gift_id, hide_my_name=True)
-                info(t("console.gift_sent", current=current_gift, total=quantity,
-                          gift_id=gift_id, recipient=recipient_info))
-                await send_notification(app, gift_id, user_id=chat_id, username=username,
-                                        current_gift=current_gift, total_gifts=quantity,
-                                        success_message=True)
-            except RPCError as ex:
-                current_balance = await get_user_balance(app)
-                await handle_gift_error(app, ex, gift_id, chat_id,
-                                        await GiftPurchaser._get_gift_price(app, gift_id), current_balance)
+                async with purchase_executor.slot(priority):
+                    with tracer.span('journal', gift_id, recipient=chat_id, unit=current_gift):
+                        await purchase_journal.start(reservation.job)
+                    reservation.started = True
+                    with tracer.span('send', gift_id, recipient=chat_id, unit=current_gift):
+                        await GiftPurchaser._send_gift(client, chat_id, gift_id, reservation.job)
                 break
+            except FloodWait as ex:
+                reservation.started = False
+                purchase_journal.record(reservation.job, 'retry')
+                purchase_pool.mark_flood_wait(client, ex.value)
+                reservation.client = purchase_pool.reassign(app, client, gift_price) or client
+                reservation.client is client and await asyncio.sleep(ex.value)
+            except RPCError as ex:
+                kind = classify_error(ex)
+                if kind == 'low_balance' and GiftPurchaser._move_drained(app, reservation, gift_price):
+                    continue
+
+                purchase_journal.record(reservation.job, 'fail', error=kind)
+                ledger.release(gift_price)
+                reservation.settled = True
+                kind == 'other' and purchase_executor.cancel(gift_id, chat_id)
+                kind in ('sold_out', 'invalid_peer') and purchase_executor.trip(kind, gift_id, chat_id)
+                kind == 'low_balance' and not purchase_pool.can_pay(app, gift_price) and purchase_executor.trip(
+                    kind, gift_id, chat_id)
+                await handle_gift_error(app, ex, gift_id, chat_id, gift_price, ledger.available)
+                return False
+
+        purchase_journal.record(reservation.job, 'done')
+        ledger.debit(gift_price)
+        reservation.settled = True
+        tracer.mark_sent(gift_id)
+        return True
+
+    @staticmethod
+    def _move_drained(app: Client, reservation: UnitReservation, gift_price: int) -> bool:
+        client = reservation.client
+        get_balance_ledger(client).schedule_reconcile(client)
+        purchase_pool.mark_drained(client, gift_price)
+        warn(t("console.account_low_balance", account=client.name, cooldown=f"{config.BREAKER_COOLDOWN:.0f}"))
+
+        other = purchase_pool.reassign(app, client, gift_price, ready_only=False)
+        if other is None:
+            return False
+
+        reservation.started = False
+        purchase_journal.record(reservation.job, 'retry')
+        reservation.client = other
+        return True
+
+    @staticmethod
+    async def _send_gift(client: Client, chat_id: int, gift_id: int, job: str) -> None:
+        form = await payment_forms.take(client, chat_id, gift_id, job)
+        if form is None:
+            return await client.send_gift(chat_id=chat_id, gift_id=gift_id, hide_my_name=True)
+
+        form_id, invoice = form
+        try:
+            await client.invoke(raw.functions.payments.SendStarsForm(form_id=form_id, invoice=invoice))
+        except RPCError as ex:
+            if getattr(ex, 'ID', None) not in PaymentForms.FALLBACK_ERRORS:
+                raise
+            await client.send_gift(chat_id=chat_id, gift_id=gift_id, hide_my_name=True)
 
     @staticmethod
     async def _handle_insufficient_balance(app: Client, gift_id: int, gift_price: int, current_balance: int,
@@ -77,4 +309,5 @@ class GiftPurchaser:
                                 current_balance=remaining_balance)
 
 
+payment_forms = PaymentForms()
 buy_gift = GiftPurchaser.buy_gift
@@ -1,102 +1,578 @@
+from __future__ import annotations
+
 import asyncio
+import datetime
+import hashlib
 import json
+import math
+import os
+import random
+import sqlite3
 import time
-from typing import Any, Callable, Dict, List, Tuple
+from collections import deque
+from contextlib import closing
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
 
-from pyrogram import Client, types
+from pyrogram import Client, raw
+from pyrogram.errors import FloodWait
 
 from app.notifications import send_summary_message
-from app.utils.logger import log_same_line, info
-from data.config import config, t
+from app.utils.logger import log_same_line, info, error
+from app.utils.tracing import tracer
+from data.config import PRIORITY_KEYS, config, t
 
 
-class GiftDetector:
-    @staticmethod
-    async def load_gift_history() -> Dict[int, dict]:
+class GiftRecord(NamedTuple):
+    """Catalog entry reduced to the fields the detector, processor and purchaser read.
+
+    availability_remains moves with every sale elsewhere, so it is left out of content_hash.
+    """
+
+    id: int
+    price: int
+    is_limited: bool
+    is_sold_out: bool
+    total_amount: int
+    upgrade_price: Optional[int]
+    availability_remains: Optional[int] = None
+
+    @classmethod
+    def from_star_gift(cls, star_gift: raw.types.StarGift) -> 'GiftRecord':
+        return cls(
+            star_gift.id,
+            star_gift.stars,
+            bool(star_gift.limited),
+            bool(star_gift.sold_out),
+            star_gift.availability_total or 0,
+            star_gift.upgrade_stars or None,
+            star_gift.availability_remains
+        )
+
+    @classmethod
+    def from_dict(cls, gift: dict) -> 'GiftRecord':
+        return cls(
+            gift['id'],
+            gift.get('price', 0),
+            bool(gift.get('is_limited')),
+            bool(gift.get('is_sold_out')),
+            gift.get('total_amount') or 0,
+            gift.get('upgrade_price'),
+            gift.get('availability_remains')
+        )
+
+    @property
+    def remaining(self) -> Optional[int]:
+        if self.availability_remains is not None:
+            return self.availability_remains
+        return self.total_amount if self.is_limited else None
+
+    @property
+    def content_hash(self) -> str:
+        return hashlib.blake2b(repr(self[:-1]).encode(), digest_size=8).hexdigest()
+
+
+class JsonHistoryStore:
+    """Full catalog snapshot in history.json, replaced atomically on every save."""
+
+    def __init__(self, path: Path = None) -> None:
+        self.path = path or config.DATA_FILEPATH
+
+    def load(self) -> Dict[int, str]:
         try:
-            with config.DATA_FILEPATH.open("r", encoding='utf-8') as file:
-                return {gift["id"]: gift for gift in json.load(file)}
+            with self.path.open("r", encoding='utf-8') as file:
+                return {gift["id"]: self._legacy_hash(gift) for gift in json.load(file)}
         except FileNotFoundError:
             return {}
 
+    def peek(self) -> Dict[int, str]:
+        return self.load()
+
+    def save(self, gifts: Dict[int, GiftRecord], upserts: Dict[int, str], removals: Set[int]) -> None:
+        temp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        with temp_path.open("w", encoding='utf-8') as file:
+            json.dump([gift._asdict() for gift in gifts.values()], file, indent=4, ensure_ascii=False)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
     @staticmethod
-    async def save_gift_history(gifts: List[dict]) -> None:
-        with config.DATA_FILEPATH.open("w", encoding='utf-8') as file:
-            json.dump(gifts, file, indent=4, default=types.Object.default, ensure_ascii=False)
+    def _legacy_hash(gift: dict) -> str:
+        try:
+            return GiftRecord.from_dict(gift).content_hash
+        except (KeyError, TypeError):
+            return ""
+
+
+class SqliteHistoryStore:
+    """Gift ids and content hashes in SQLite; each save is one transaction with only the changed rows."""
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path: Path = None, legacy_path: Path = None) -> None:
+        self.path = path or config.HISTORY_DB_FILEPATH
+        self.legacy_path = legacy_path or config.DATA_FILEPATH
+
+    def load(self) -> Dict[int, str]:
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute("CREATE TABLE IF NOT EXISTS gifts (id INTEGER PRIMARY KEY, hash TEXT NOT NULL)")
+                self._schema_version(connection) < self.SCHEMA_VERSION and self._migrate_legacy(connection)
+            return dict(connection.execute("SELECT id, hash FROM gifts"))
+
+    def peek(self) -> Dict[int, str]:
+        """What load would return, read without creating or migrating the database."""
+        gifts, migrated = {}, False
+        try:
+            with closing(sqlite3.connect(f'{self.path.resolve().as_uri()}?mode=ro', uri=True)) as connection:
+                migrated = self._schema_version(connection) >= self.SCHEMA_VERSION
+                gifts = dict(connection.execute("SELECT id, hash FROM gifts"))
+        except sqlite3.Error:
+            pass
+        return gifts if migrated else {**JsonHistoryStore(self.legacy_path).load(), **gifts}
+
+    def save(self, gifts: Dict[int, GiftRecord], upserts: Dict[int, str], removals: Set[int]) -> None:
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.executemany(
+                    "INSERT INTO gifts (id, hash) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET hash = excluded.hash",
+                    upserts.items()
+                )
+                connection.executemany("DELETE FROM gifts WHERE id = ?", ((gift_id,) for gift_id in removals))
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
 
     @staticmethod
-    async def fetch_current_gifts(app: Client) -> Tuple[Dict[int, dict], List[int]]:
-        gifts = [
-            json.loads(json.dumps(gift, default=types.Object.default, ensure_ascii=False))
-            for gift in await app.get_available_gifts()
-        ]
-        gifts_dict = {gift["id"]: gift for gift in gifts}
-        return gifts_dict, list(gifts_dict.keys())
+    def _schema_version(connection: sqlite3.Connection) -> int:
+        return connection.execute("PRAGMA user_version").fetchone()[0]
+
+    def _migrate_legacy(self, connection: sqlite3.Connection) -> None:
+        legacy_gifts = JsonHistoryStore(self.legacy_path).load()
+        connection.executemany("INSERT OR IGNORE INTO gifts (id, hash) VALUES (?, ?)", legacy_gifts.items())
+        connection.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        legacy_gifts and info(f'Migrated {len(legacy_gifts)} gifts from {self.legacy_path.name} to {self.path.name}')
+
+
+class MemoryHistoryStore:
+    """History kept in memory from a given seed; saves are dropped, so nothing on disk changes."""
 
+    path = None
+
+    def __init__(self, seed: Dict[int, str]) -> None:
+        self.seed = seed
+
+    def load(self) -> Dict[int, str]:
+        return dict(self.seed)
+
+    def save(self, gifts: Dict[int, GiftRecord], upserts: Dict[int, str], removals: Set[int]) -> None:
+        pass
+
+
+HISTORY_BACKENDS = {
+    'json': JsonHistoryStore,
+    'sqlite': SqliteHistoryStore
+}
+
+
+def create_history_store():
+    return HISTORY_BACKENDS.get(config.HISTORY_BACKEND, SqliteHistoryStore)()
+
+
+class GiftDetector:
     @staticmethod
-    def categorize_skipped_gifts(gift_data: Dict[str, Any]) -> Dict[str, int]:
+    def categorize_skipped_gifts(gift: GiftRecord) -> Dict[str, int]:
         skip_rules = {
-            'sold_out_count': gift_data.get("is_sold_out", False),
-            'non_limited_count': not gift_data.get("is_limited"),
-            'non_upgradable_count': config.PURCHASE_ONLY_UPGRADABLE_GIFTS and "upgrade_price" not in gift_data
+            'sold_out_count': gift.is_sold_out,
+            'non_limited_count': not gift.is_limited,
+            'non_upgradable_count': config.PURCHASE_ONLY_UPGRADABLE_GIFTS and gift.upgrade_price is None
         }
         return {key: 1 if condition else 0 for key, condition in skip_rules.items()}
 
     @staticmethod
-    def prioritize_gifts(gifts: Dict[int, dict], gift_ids: List[int]) -> List[Tuple[int, dict]]:
-        for gift_id, gift_data in gifts.items():
-            gift_data["position"] = len(gift_ids) - gift_ids.index(gift_id)
+    def prioritize_gifts(gifts: Dict[int, GiftRecord], gift_ids: List[int]) -> List[Tuple[int, GiftRecord]]:
+        positions = {gift_id: -index for index, gift_id in enumerate(gift_ids)}
+        priority_keys = [PRIORITY_KEYS[key] for key in config.PRIORITY_KEYS]
+
+        return sorted(gifts.items(), key=lambda item: (
+            *(priority_key(item[1]) for priority_key in priority_keys),
+            positions[item[0]]
+        ))
+
+
+class CatalogFetcher:
+    """Polls payments.GetStarGifts with the last seen hash so unchanged catalogs cost nothing."""
+
+    def __init__(self) -> None:
+        self.catalog_hash = 0
+
+    async def fetch(self, app: Client) -> Optional[Tuple[Dict[int, GiftRecord], List[int]]]:
+        result = await app.invoke(raw.functions.payments.GetStarGifts(hash=self.catalog_hash))
+
+        if isinstance(result, raw.types.payments.StarGiftsNotModified):
+            return None
+
+        self.catalog_hash = result.hash
+        gifts_dict = {
+            star_gift.id: GiftRecord.from_star_gift(star_gift)
+            for star_gift in result.gifts
+            if isinstance(star_gift, raw.types.StarGift)
+        }
+        return gifts_dict, list(gifts_dict.keys())
+
+
+class CatalogCache:
+    """Latest catalog snapshot published by the monitor, so the purchase path looks gifts up without RPCs.
+
+    With several watchers polling, a snapshot whose fetch started before the cached one's is ignored.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.gifts: Dict[int, GiftRecord] = {}
+        self.observed_at = float('-inf')
+        self._fetcher = CatalogFetcher()
+        self._updated_at = float('-inf')
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self._updated_at <= self.ttl
+
+    def update(self, gifts: Optional[Dict[int, GiftRecord]], catalog_hash: int,
+               observed_at: Optional[float] = None) -> None:
+        observed_at = time.perf_counter() if observed_at is None else observed_at
+        if gifts is not None and observed_at >= self.observed_at:
+            self.gifts = gifts
+            self.observed_at = observed_at
+            self._fetcher.catalog_hash = catalog_hash
+        self._updated_at = time.monotonic()
+
+    async def get(self, app: Client, gift_id: int) -> Optional[GiftRecord]:
+        self.is_fresh or await self.refresh(app)
+        return self.gifts.get(gift_id)
+
+    async def refresh(self, app: Client) -> None:
+        fetch_started = time.perf_counter()
+        catalog = await self._fetcher.fetch(app)
+        self.update(catalog and catalog[0], self._fetcher.catalog_hash, fetch_started)
+
 
-        sorted_gifts = sorted(gifts.items(), key=lambda x: x[1]["position"])
+class CatalogState:
+    """Known catalog kept in memory; history is read once and written only on change.
 
-        return sorted(sorted_gifts, key=lambda x: (
-            x[1].get("total_amount", float('inf')) if x[1].get("is_limited", False) else float('inf'),
-            x[1]["position"]
-        )) if config.PRIORITIZE_LOW_SUPPLY else sorted_gifts
+    Snapshots are applied in the order their fetches started, so a slow poll that returns after a
+    newer one cannot roll the known catalog back. A failed save is retried on a backoff timer.
+    """
+
+    SAVE_RETRY_DELAY = 1.0
+    SAVE_RETRY_MAX_DELAY = 300.0
+
+    def __init__(self, store=None) -> None:
+        self.store = store or create_history_store()
+        self.known_hashes: Optional[Dict[int, str]] = None
+        self.observed_at = float('-inf')
+        self._persisted_hashes: Dict[int, str] = {}
+        self._pending_save: Optional[Tuple[Dict[int, GiftRecord], Dict[int, str]]] = None
+        self._save_task: Optional[asyncio.Task] = None
+        self._retry_delay = self.SAVE_RETRY_DELAY
+        self._retry_handle: Optional[asyncio.TimerHandle] = None
+
+    async def diff(self, current_gifts: Dict[int, GiftRecord],
+                   observed_at: Optional[float] = None) -> Dict[int, GiftRecord]:
+        self.known_hashes is None and await self._load()
+
+        observed_at = time.perf_counter() if observed_at is None else observed_at
+        if observed_at < self.observed_at:
+            return {}
+        self.observed_at = observed_at
+
+        new_gifts = {
+            gift_id: gift_data for gift_id, gift_data in current_gifts.items()
+            if gift_id not in self.known_hashes
+        }
+
+        current_hashes = {gift_id: gift.content_hash for gift_id, gift in current_gifts.items()}
+        current_hashes != self.known_hashes and self._schedule_save(current_gifts, current_hashes)
+        self.known_hashes = current_hashes
+        return new_gifts
+
+    async def flush(self) -> None:
+        self._retry_handle and self._retry_handle.cancel()
+        self._retry_handle = None
+        self._pending_save and self._schedule_save(*self._pending_save)
+        self._save_task and await self._save_task
+
+    async def _load(self) -> None:
+        self.known_hashes = await asyncio.to_thread(self.store.load)
+        self._persisted_hashes = dict(self.known_hashes)
+
+    def _schedule_save(self, gifts: Dict[int, GiftRecord], hashes: Dict[int, str]) -> None:
+        self._pending_save = gifts, hashes
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self._save_pending())
+
+    async def _save_pending(self) -> None:
+        while self._pending_save is not None:
+            gifts, hashes = self._pending_save
+            self._pending_save = None
+
+            upserts = {
+                gift_id: gift_hash for gift_id, gift_hash in hashes.items()
+                if self._persisted_hashes.get(gift_id) != gift_hash
+            }
+            removals = self._persisted_hashes.keys() - hashes.keys()
+
+            try:
+                await asyncio.to_thread(self.store.save, gifts, upserts, removals)
+                self._persisted_hashes = hashes
+                self._retry_delay = self.SAVE_RETRY_DELAY
+            except (OSError, sqlite3.Error) as ex:
+                error(f'Failed to save gift history to {self.store.path}, retrying in '
+                      f'{self._retry_delay:.0f}s: {str(ex)}')
+                self._pending_save = self._pending_save or (gifts, hashes)
+                self._retry_handle = self._retry_handle or asyncio.get_running_loop().call_later(
+                    self._retry_delay, self._retry_save)
+                self._retry_delay = min(self._retry_delay * 2, self.SAVE_RETRY_MAX_DELAY)
+                break
+
+    def _retry_save(self) -> None:
+        self._retry_handle = None
+        self._pending_save and self._schedule_save(*self._pending_save)
+
+
+class PollScheduler:
+    """Picks the delay before the next catalog poll without ever blocking the event loop.
+
+    Polls run at MIN_POLL_INTERVAL inside DROP_WINDOWS and for CHANGE_BOOST_DURATION seconds after
+    a catalog change, unless a FloodWait was hit within FLOOD_COOLDOWN. Once the catalog has been
+    idle for IDLE_BACKOFF_AFTER seconds the interval grows towards MAX_POLL_INTERVAL.
+    """
+
+    IDLE_BACKOFF_FACTOR = 1.25
+    RATE_WINDOW = 60.0
+
+    def __init__(self) -> None:
+        now = time.monotonic()
+        self._started = now
+        self._first_poll = True
+        self._changed_at = now
+        self._boost_until = 0.0
+        self._flood_until = 0.0
+        self._idle_interval = config.INTERVAL
+        self._poll_times = deque()
+
+    @property
+    def poll_rate(self) -> float:
+        now = time.monotonic()
+        span = min(now - self._started, self.RATE_WINDOW)
+        polls = sum(1 for polled_at in self._poll_times if polled_at >= now - self.RATE_WINDOW)
+        return polls * 60.0 / span if polls and span > 0 else 0.0
+
+    def record_poll(self, changed: bool) -> None:
+        now = time.monotonic()
+        self._poll_times.append(now)
+        while self._poll_times[0] < now - self.RATE_WINDOW:
+            self._poll_times.popleft()
+
+        if changed and not self._first_poll:
+            self._changed_at = now
+            self._boost_until = now + config.CHANGE_BOOST_DURATION
+            self._idle_interval = config.INTERVAL
+        self._first_poll = False
+
+    def record_flood_wait(self, seconds: float) -> None:
+        self._flood_until = time.monotonic() + seconds + config.FLOOD_COOLDOWN
+
+    def next_interval(self) -> float:
+        now = time.monotonic()
+        is_fast = self._in_drop_window() or now < self._boost_until
+
+        if is_fast:
+            interval = config.MIN_POLL_INTERVAL if now >= self._flood_until else config.INTERVAL
+        elif now - self._changed_at > config.IDLE_BACKOFF_AFTER:
+            self._idle_interval = min(self._idle_interval * self.IDLE_BACKOFF_FACTOR, config.MAX_POLL_INTERVAL)
+            interval = self._idle_interval
+        else:
+            interval = config.INTERVAL
+
+        return max(interval * random.uniform(1 - config.POLL_JITTER, 1 + config.POLL_JITTER), 0.0)
+
+    @staticmethod
+    def _in_drop_window() -> bool:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        minute = now.hour * 60 + now.minute
+        return any(
+            start <= minute < end if start <= end else (minute >= start or minute < end)
+            for start, end in config.DROP_WINDOWS
+        )
+
+
+class CatalogWatchers:
+    """State shared by the watcher sessions: one CatalogState, first-seen times and the set of dispatched gifts.
+
+    Watcher i of N polls index / N of an interval after watcher 0's last poll, re-aligned every cycle.
+    """
+
+    def __init__(self, clients: Sequence[Client], store=None) -> None:
+        self.clients = list(clients)
+        self.state = CatalogState(store)
+        self.schedulers = [PollScheduler() for _ in self.clients]
+        self.lock = asyncio.Lock()
+        self.first_seen: Dict[int, Tuple[str, float]] = {}
+        self.dispatched: Set[int] = set()
+        self.anchor: Optional[float] = None
+
+    @property
+    def poll_rate(self) -> float:
+        return sum(scheduler.poll_rate for scheduler in self.schedulers)
+
+    def phase_delay(self, index: int, interval: Optional[float] = None) -> float:
+        interval = config.INTERVAL if interval is None else interval
+        offset = interval * index / len(self.clients)
+        if self.anchor is None or interval <= 0:
+            return offset
+
+        now = time.monotonic()
+        slot = self.anchor + offset
+        return slot + max(math.ceil((now - slot) / interval), 0) * interval - now
+
+    def observe(self, watcher: str, gift_ids: Iterable[int]) -> None:
+        now = time.monotonic()
+        for gift_id in gift_ids:
+            first_watcher, first_seen_at = self.first_seen.setdefault(gift_id, (watcher, now))
+            first_watcher != watcher and info(t("console.first_seen", gift_id=gift_id, watcher=first_watcher,
+                                                lead=f"{now - first_seen_at:.2f}", other=watcher))
+
+    def claim(self, gifts: Dict[int, GiftRecord]) -> Dict[int, GiftRecord]:
+        claimed = {gift_id: gift for gift_id, gift in gifts.items() if gift_id not in self.dispatched}
+        self.dispatched.update(claimed)
+        return claimed
+
+
+class PurchaseQueue:
+    """New-gift batches handed from the watchers to the purchase workers, so polling never waits on purchases."""
+
+    def __init__(self) -> None:
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def put(self, new_gifts: Dict[int, GiftRecord], gift_ids: List[int]) -> None:
+        self.queue.put_nowait((new_gifts, gift_ids, time.perf_counter()))
+
+    async def get(self) -> Tuple[Dict[int, GiftRecord], List[int]]:
+        new_gifts, gift_ids, enqueued = await self.queue.get()
+        wait_ms = tracer.record('queue', enqueued, *new_gifts)
+        info(t("console.queue_wait", count=len(new_gifts), wait=f"{wait_ms:.0f}", depth=self.depth))
+        return new_gifts, gift_ids
 
 
 class GiftMonitor:
     @staticmethod
-    async def run_detection_loop(app: Client, callback: Callable) -> None:
+    async def run_detection_loop(app: Client, callback: Callable, watchers: Sequence[Client] = (),
+                                 store=None) -> None:
+        shared = CatalogWatchers([app, *watchers], store)
+        purchases = PurchaseQueue()
+
+        try:
+            await asyncio.gather(
+                *(GiftMonitor._watch(index, shared, purchases) for index in range(len(shared.clients))),
+                *(GiftMonitor._work(app, purchases, callback) for _ in range(config.PURCHASE_WORKERS))
+            )
+        finally:
+            await shared.state.flush()
+
+    @staticmethod
+    async def _work(app: Client, purchases: PurchaseQueue, callback: Callable) -> None:
+        while True:
+            new_gifts, gift_ids = await purchases.get()
+            try:
+                await GiftMonitor._process_new_gifts(app, new_gifts, gift_ids, callback)
+            except Exception as ex:
+                error(t("console.batch_error", gifts=", ".join(map(str, new_gifts)), error=str(ex)))
+            finally:
+                purchases.queue.task_done()
+
+    @staticmethod
+    async def _watch(index: int, shared: CatalogWatchers, purchases: PurchaseQueue) -> None:
         animation_counter = 0
+        client = shared.clients[index]
+        watcher = Path(client.name).name
+        fetcher = CatalogFetcher()
+        scheduler = shared.schedulers[index]
+        known_ids: Optional[Set[int]] = None
+        retry_delay = 0.0
+
+        await asyncio.sleep(shared.phase_delay(index))
 
         while True:
-            animation_counter = (animation_counter + 1) % 4
-            log_same_line(f'{t("console.gift_checking")}{"." * animation_counter}')
-            time.sleep(0.2)
+            if index == 0:
+                shared.anchor = time.monotonic()
+                tracer.log_summary_due()
+                animation_counter = (animation_counter + 1) % 4
+                log_same_line(f'{t("console.gift_checking")}{"." * animation_counter} '
+                              f'({t("console.poll_rate", rate=f"{shared.poll_rate:.1f}")}, '
+                              f'{t("console.queue_depth", depth=purchases.depth)})')
 
-            app.is_connected or await app.start()
+            fetch_started = time.perf_counter()
+            try:
+                client.is_connected or await client.start()
+                catalog = await fetcher.fetch(client)
+                fetch_ms = tracer.record('fetch', fetch_started)
+            except FloodWait as ex:
+                scheduler.record_flood_wait(ex.value)
+                await asyncio.sleep(ex.value)
+                continue
+            except Exception as ex:
+                retry_delay = min(max(retry_delay * 2, config.INTERVAL), config.MAX_POLL_INTERVAL)
+                error(t("console.watcher_error", watcher=watcher, error=str(ex) or type(ex).__name__,
+                        delay=f"{retry_delay:.0f}"))
+                await asyncio.sleep(retry_delay)
+                continue
 
-            old_gifts = await GiftDetector.load_gift_history()
-            current_gifts, gift_ids = await GiftDetector.fetch_current_gifts(app)
+            retry_delay = 0.0
 
-            new_gifts = {
-                gift_id: gift_data for gift_id, gift_data in current_gifts.items()
-                if gift_id not in old_gifts
-            }
+            catalog_cache.update(catalog and catalog[0], fetcher.catalog_hash, fetch_started)
+            scheduler.record_poll(catalog is not None)
+
+            if catalog:
+                current_gifts, gift_ids = catalog
+                known_ids is not None and shared.observe(watcher, current_gifts.keys() - known_ids)
+                known_ids = set(current_gifts)
+
+                diff_started = time.perf_counter()
+                async with shared.lock:
+                    new_gifts = shared.claim(await shared.state.diff(current_gifts, fetch_started))
+                diff_ms = tracer.record('diff', diff_started)
 
-            new_gifts and await GiftMonitor._process_new_gifts(app, new_gifts, gift_ids, callback)
+                if new_gifts:
+                    tracer.begin(new_gifts, fetch_started, [('fetch', fetch_started, fetch_ms),
+                                                            ('diff', diff_started, diff_ms)])
+                    purchases.put(new_gifts, gift_ids)
 
-            await GiftDetector.save_gift_history(list(current_gifts.values()))
-            await asyncio.sleep(config.INTERVAL)
+            await asyncio.sleep(shared.phase_delay(index, scheduler.next_interval()))
 
     @staticmethod
-    async def _process_new_gifts(app: Client, new_gifts: Dict[int, dict],
+    async def _process_new_gifts(app: Client, new_gifts: Dict[int, GiftRecord],
                                  gift_ids: List[int], callback: Callable) -> None:
         info(f'{t("console.new_gifts")} {len(new_gifts)}')
 
         skip_counts = {'sold_out_count': 0, 'non_limited_count': 0, 'non_upgradable_count': 0}
 
-        for gift_data in new_gifts.values():
-            gift_skips = GiftDetector.categorize_skipped_gifts(gift_data)
+        for gift in new_gifts.values():
+            gift_skips = GiftDetector.categorize_skipped_gifts(gift)
             for key, value in gift_skips.items():
                 skip_counts[key] += value
 
-        prioritized_gifts = GiftDetector.prioritize_gifts(new_gifts, gift_ids)
+        with tracer.span('prioritize', *new_gifts):
+            prioritized_gifts = GiftDetector.prioritize_gifts(new_gifts, gift_ids)
 
-        for gift_id, gift_data in prioritized_gifts:
-            gift_data['id'] = gift_id
-            await callback(app, gift_data)
+        await callback(app, [gift for _, gift in prioritized_gifts])
 
         await send_summary_message(app, **skip_counts)
 
@@ -106,4 +582,5 @@ class GiftMonitor:
                                              non_upgradable=skip_counts['non_upgradable_count']))
 
 
+catalog_cache = CatalogCache(config.CATALOG_CACHE_TTL)
 gift_monitoring = GiftMonitor.run_detection_loop
@@ -1,45 +1,57 @@
-from typing import Optional, Tuple
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 from pyrogram import Client
 
+from app.utils.logger import warn
+from data.config import config, t
+
 
 class UserHelper:
     @staticmethod
-    async def get_user_balance(client: Client) -> int:
+    async def get_recipient_info(app: Client, chat_id: int) -> Tuple[str, str]:
         try:
-            return await client.get_stars_balance()
+            return await recipient_cache.get(app, chat_id)
         except Exception:
-            return 0
+            return str(chat_id), ""
 
     @staticmethod
-    async def get_recipient_info(app: Client, chat_id: int) -> Tuple[str, str]:
-        try:
-            user = await app.get_chat(chat_id)
-            username = user.username or ""
-
-            format_rules = {
-                'with_username': {
-                    'condition': lambda: bool(username),
-                    'formatter': lambda: f"@{username.strip()}"
-                },
-                'numeric_id': {
-                    'condition': lambda: isinstance(chat_id, int) or str(chat_id).isdigit(),
-                    'formatter': lambda: str(chat_id)
-                },
-                'string_fallback': {
-                    'condition': lambda: True,
-                    'formatter': lambda: f"@{chat_id}"
-                }
+    def format_recipient(chat_id: Union[int, str], username: str) -> Tuple[str, str]:
+        format_rules = {
+            'with_username': {
+                'condition': lambda: bool(username),
+                'formatter': lambda: f"@{username.strip()}"
+            },
+            'numeric_id': {
+                'condition': lambda: isinstance(chat_id, int) or str(chat_id).isdigit(),
+                'formatter': lambda: str(chat_id)
+            },
+            'string_fallback': {
+                'condition': lambda: True,
+                'formatter': lambda: f"@{chat_id}"
             }
+        }
+
+        recipient_info = next(
+            (rule['formatter']() for rule in format_rules.values() if rule['condition']()),
+            str(chat_id)
+        )
 
-            recipient_info = next(
-                (rule['formatter']() for rule in format_rules.values() if rule['condition']()),
-                str(chat_id)
-            )
+        return recipient_info, username
 
-            return recipient_info, username
-        except Exception:
-            return str(chat_id), ""
+    @staticmethod
+    async def prewarm_recipients(app: Client, channel: bool = True) -> List[Union[int, str]]:
+        chat_ids = list(dict.fromkeys(
+            [recipient for range_config in config.GIFT_RANGES for recipient in range_config['recipients']] +
+            ([config.CHANNEL_ID] if channel and config.CHANNEL_ID else [])
+        ))
+
+        unresolved = await recipient_cache.prewarm(app, chat_ids)
+        unresolved and warn(t("console.unresolved_recipients",
+                              recipients=", ".join(str(chat_id) for chat_id in unresolved)))
+        return unresolved
 
     @staticmethod
     def format_user_reference(user_id: int, username: Optional[str] = None) -> str:
@@ -64,6 +76,155 @@ class UserHelper:
         )
 
 
-get_user_balance = UserHelper.get_user_balance
+class RecipientCache:
+    """Resolved recipients by chat id with LRU eviction; the purchase path never waits on get_chat.
+
+    Stale, evicted and unknown recipients are served from cache or as a bare id while a background
+    refresh runs. Failed lookups are cached for the same TTL, so they are not retried on every purchase.
+    """
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._refresh_tasks: Dict[Union[int, str], asyncio.Task] = {}
+
+    async def get(self, app: Client, chat_id: Union[int, str]) -> Tuple[str, str]:
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            self._schedule_refresh(app, chat_id)
+            return UserHelper.format_recipient(chat_id, "")
+
+        recipient, resolved_at = entry
+        self._entries.move_to_end(chat_id)
+        time.monotonic() - resolved_at > self.ttl and self._schedule_refresh(app, chat_id)
+        return recipient
+
+    async def resolve(self, app: Client, chat_id: Union[int, str]) -> Tuple[str, str]:
+        try:
+            chat = await app.get_chat(chat_id)
+        except Exception:
+            entry = self._entries.get(chat_id)
+            self._store(chat_id, entry[0] if entry else UserHelper.format_recipient(chat_id, ""))
+            raise
+
+        recipient = UserHelper.format_recipient(chat_id, chat.username or "")
+        self._store(chat_id, recipient)
+        return recipient
+
+    async def prewarm(self, app: Client, chat_ids: Iterable[Union[int, str]]) -> List[Union[int, str]]:
+        chat_ids = list(chat_ids)
+        results = await asyncio.gather(*(self.resolve(app, chat_id) for chat_id in chat_ids),
+                                       return_exceptions=True)
+        return [chat_id for chat_id, result in zip(chat_ids, results) if isinstance(result, Exception)]
+
+    def _store(self, chat_id: Union[int, str], recipient: Tuple[str, str]) -> None:
+        self._entries[chat_id] = recipient, time.monotonic()
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _schedule_refresh(self, app: Client, chat_id: Union[int, str]) -> None:
+        task = self._refresh_tasks.get(chat_id)
+        if task is None or task.done():
+            self._refresh_tasks[chat_id] = asyncio.create_task(self._refresh(app, chat_id))
+
+    async def _refresh(self, app: Client, chat_id: Union[int, str]) -> None:
+        try:
+            await self.resolve(app, chat_id)
+        except Exception as ex:
+            warn(f'Failed to refresh recipient {chat_id}: {str(ex)}')
+        finally:
+            self._refresh_tasks.pop(chat_id, None)
+
+
+class BalanceLedger:
+    """One account's stars: one server read, then local reservations, debits and holds."""
+
+    _ledgers: Dict[str, 'BalanceLedger'] = {}
+
+    def __init__(self) -> None:
+        self.balance: Optional[int] = None
+        self.reserved = 0
+        self._holds: List[Tuple[int, float, Callable[[bool], None]]] = []
+        self._held_drop: Optional[int] = 0
+        self.synced_at = float('-inf')
+        self._debited = 0
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self._rerun = False
+
+    @classmethod
+    def for_client(cls, client: Client) -> 'BalanceLedger':
+        return cls._ledgers.setdefault(client.name, cls())
+
+    @property
+    def available(self) -> int:
+        return (self.balance or 0) - self.reserved - self.held
+
+    @property
+    def held(self) -> int:
+        return sum(price for price, _, _ in self._holds)
+
+    async def refresh(self, client: Client) -> int:
+        debited, started, expected = self._debited, time.monotonic(), self.balance
+        try:
+            balance = int(await client.get_stars_balance())
+            self.balance = balance - (self._debited - debited)
+            drop = expected - balance if expected is not None and self._debited == debited else None
+            self._holds and self._track_drop(drop)
+            self._holds and all(settle_at <= started for _, settle_at, _ in self._holds) and self._settle()
+            self.synced_at = started
+        except Exception as ex:
+            warn(f'Failed to reconcile stars balance: {str(ex)}')
+        return self.available
+
+    async def ensure_loaded(self, client: Client) -> int:
+        if self.balance is None:
+            return await self.refresh(client)
+
+        time.monotonic() - self.synced_at > config.BALANCE_RECONCILE_INTERVAL and self.schedule_reconcile(client)
+        return self.available
+
+    def schedule_reconcile(self, client: Client) -> None:
+        if self._reconcile_task is not None and not self._reconcile_task.done():
+            self._rerun = True
+            return
+
+        self._rerun = False
+        self._reconcile_task = asyncio.create_task(self.refresh(client))
+        self._reconcile_task.add_done_callback(lambda _: self._rerun and self.schedule_reconcile(client))
+
+    def reserve(self, price: int, quantity: int) -> int:
+        affordable = min(quantity, max(self.available, 0) // price) if price > 0 else quantity
+        self.reserved += affordable * price
+        return affordable
+
+    def debit(self, price: int) -> None:
+        self.reserved -= price
+        self.balance = (self.balance or 0) - price
+        self._debited += price
+
+    def hold(self, client: Client, price: int, on_settled: Callable[[bool], None]) -> None:
+        self.reserved -= price
+        self._holds.append((price, time.monotonic() + config.HOLD_SETTLE_DELAY, on_settled))
+        asyncio.get_running_loop().call_later(config.HOLD_SETTLE_DELAY, self.schedule_reconcile, client)
+
+    def release(self, amount: int) -> None:
+        self.reserved = max(self.reserved - amount, 0)
+
+    def _track_drop(self, drop: Optional[int]) -> None:
+        self._held_drop = None if drop is None or self._held_drop is None else self._held_drop + drop
+
+    def _settle(self) -> None:
+        holds, spent = self._holds, self._held_drop
+        outcome = {0: False, self.held: True}.get(spent)
+        self._holds, self._held_drop = [], 0
+        for _, _, on_settled in holds:
+            outcome is not None and on_settled(outcome)
+
+
+recipient_cache = RecipientCache(config.RECIPIENT_CACHE_TTL, config.RECIPIENT_CACHE_SIZE)
 get_recipient_info = UserHelper.get_recipient_info
 format_user_reference = UserHelper.format_user_reference
+prewarm_recipients = UserHelper.prewarm_recipients
+get_balance_ledger = BalanceLedger.for_client
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.utils.logger import error, info
+from data.config import config
+
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float('inf'))
+
+
+class LatencyHistogram:
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS_MS)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, duration_ms: float) -> None:
+        self.counts[bisect_left(BUCKETS_MS, duration_ms)] += 1
+        self.total += 1
+        self.sum_ms += duration_ms
+
+    def percentile(self, fraction: float) -> float:
+        threshold = fraction * self.total
+        running = 0
+        for bucket, count in zip(BUCKETS_MS, self.counts):
+            running += count
+            if running >= threshold:
+                return bucket
+        return BUCKETS_MS[-1]
+
+    def summary(self) -> str:
+        mean = self.sum_ms / self.total if self.total else 0.0
+        return f"n={self.total} mean={mean:.1f}ms p50<={self.percentile(0.5)}ms p95<={self.percentile(0.95)}ms"
+
+
+class GiftTimeline:
+    __slots__ = ('gift_id', 'detected_at', 'anchor', 'spans', 'first_send_ms')
+
+    def __init__(self, gift_id: int, anchor: float) -> None:
+        self.gift_id = gift_id
+        self.detected_at = time.time() - (time.perf_counter() - anchor)
+        self.anchor = anchor
+        self.spans: List[dict] = []
+        self.first_send_ms: Optional[float] = None
+
+    def add(self, stage: str, started: float, duration_ms: float, **details) -> None:
+        self.spans.append({'stage': stage, 'start_ms': round((started - self.anchor) * 1000, 3),
+                           'duration_ms': round(duration_ms, 3), **details})
+
+    def as_record(self, outcome: str) -> dict:
+        return {'gift_id': self.gift_id, 'detected_at': self.detected_at, 'outcome': outcome,
+                'first_send_ms': self.first_send_ms, 'spans': self.spans}
+
+
+class Tracer:
+    """Per-stage latency histograms plus a timeline per detected gift, appended as JSON lines to TRACE_FILEPATH."""
+
+    SUMMARY_INTERVAL = 600.0
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self.path = path
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.timelines: Dict[int, GiftTimeline] = {}
+        self._summary_at = time.monotonic()
+
+    @contextmanager
+    def span(self, stage: str, *gift_ids: int, **details) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, started, *gift_ids, **details)
+
+    def record(self, stage: str, started: float, *gift_ids: int, **details) -> float:
+        duration_ms = (time.perf_counter() - started) * 1000
+        self.histograms.setdefault(stage, LatencyHistogram()).observe(duration_ms)
+
+        for gift_id in gift_ids:
+            timeline = self.timelines.get(gift_id)
+            timeline and timeline.add(stage, started, duration_ms, **details)
+        return duration_ms
+
+    def begin(self, gift_ids: Iterable[int], anchor: float, spans: Iterable[Tuple[str, float, float]]) -> None:
+        spans = list(spans)
+        for gift_id in gift_ids:
+            timeline = self.timelines.setdefault(gift_id, GiftTimeline(gift_id, anchor))
+            for stage, started, duration_ms in spans:
+                timeline.add(stage, started, duration_ms)
+
+    def mark_sent(self, gift_id: int) -> None:
+        timeline = self.timelines.get(gift_id)
+        if timeline and timeline.first_send_ms is None:
+            timeline.first_send_ms = round((time.perf_counter() - timeline.anchor) * 1000, 3)
+
+    def finish(self, gift_id: int) -> None:
+        timeline = self.timelines.pop(gift_id, None)
+        if timeline is None or self.path is None:
+            return
+
+        outcome = 'purchased' if timeline.first_send_ms is not None else 'not_purchased'
+        line = json.dumps(timeline.as_record(outcome), ensure_ascii=False)
+        asyncio.get_running_loop().run_in_executor(None, self._append, line)
+
+    def summary(self) -> str:
+        return "\n".join(f"{stage}: {histogram.summary()}" for stage, histogram in self.histograms.items())
+
+    def log_summary(self) -> None:
+        self._summary_at = time.monotonic()
+        self.histograms and info(f"Stage latency:\n{self.summary()}")
+
+    def log_summary_due(self) -> None:
+        time.monotonic() - self._summary_at >= self.SUMMARY_INTERVAL and self.log_summary()
+
+    def _append(self, line: str) -> None:
+        try:
+            with self.path.open("a", encoding='utf-8') as file:
+                file.write(line + "\n")
+        except OSError as ex:
+            error(f'Failed to write gift timeline to {self.path}: {str(ex)}')
+
+
+tracer = Tracer(config.TRACE_FILEPATH if config.TRACING else None)
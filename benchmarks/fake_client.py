@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Union
+
+from pyrogram import raw
+from pyrogram.errors import BadRequest, FloodWait
+
+
+def rpc_error(error_id: str) -> BadRequest:
+    return type(error_id.title().replace('_', ''), (BadRequest,), {'ID': error_id, 'MESSAGE': error_id})()
+
+
+class FakeCatalog:
+    """Server-side catalog shared by every FakeClient: star gifts, remaining supply and the Star Gifts hash."""
+
+    def __init__(self, size: int = 100, price: int = 25, supply: int = 0) -> None:
+        self.gifts: Dict[int, dict] = {}
+        self.catalog_hash = 1
+        self.next_id = 1000
+        self.add_gifts(size, price, supply)
+
+    def add_gifts(self, count: int, price: int, supply: int = 0, upgrade_price: Optional[int] = None) -> List[int]:
+        gift_ids = []
+
+        for _ in range(count):
+            self.next_id += 1
+            self.gifts[self.next_id] = {'price': price, 'supply': supply, 'remains': supply, 'upgrade': upgrade_price}
+            gift_ids.append(self.next_id)
+
+        self.catalog_hash += 1
+        return gift_ids
+
+    def take(self, gift_id: int) -> bool:
+        gift = self.gifts.get(gift_id)
+        if gift is None or (gift['supply'] and gift['remains'] <= 0):
+            return False
+
+        gift['supply'] and gift.update(remains=gift['remains'] - 1)
+        gift['supply'] and gift['remains'] == 0 and self._bump()
+        return True
+
+    def star_gifts(self) -> List[raw.types.StarGift]:
+        return [
+            raw.types.StarGift(
+                id=gift_id, sticker=None, stars=gift['price'], convert_stars=gift['price'],
+                limited=bool(gift['supply']) or None, sold_out=bool(gift['supply']) and gift['remains'] == 0 or None,
+                availability_total=gift['supply'] or None, availability_remains=gift['remains'] if gift['supply'] else None,
+                upgrade_stars=gift['upgrade']
+            )
+            for gift_id, gift in self.gifts.items()
+        ]
+
+    def _bump(self) -> None:
+        self.catalog_hash += 1
+
+
+class FakeClient:
+    """In-process stand-in for pyrogram.Client covering the calls the buyer makes, raw payment forms included.
+
+    Every call sleeps latency +/- jitter seconds and is counted in rpc_counts; send_gift costs two
+    round trips, like Pyrogram's form fetch plus submit. A send (send_gift or
+    SendStarsForm) can fail with FloodWait or BALANCE_TOO_LOW at the configured rates, and fails with
+    STARGIFT_USAGE_LIMITED once the gift's supply is gone. With raw_payments off, GetPaymentForm fails
+    with FORM_UNSUPPORTED, so the buyer falls back to send_gift.
+    """
+
+    def __init__(self, catalog: FakeCatalog, name: str = "fake", balance: int = 1_000_000,
+                 latency: float = 0.05, jitter: float = 0.0, flood_wait_rate: float = 0.0,
+                 flood_wait_seconds: int = 1, balance_error_rate: float = 0.0, raw_payments: bool = True,
+                 seed: Optional[int] = None) -> None:
+        self.catalog = catalog
+        self.name = name
+        self.balance = balance
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_wait_rate = flood_wait_rate
+        self.flood_wait_seconds = flood_wait_seconds
+        self.balance_error_rate = balance_error_rate
+        self.raw_payments = raw_payments
+        self.is_connected = True
+        self.rpc_counts: Counter = Counter()
+        self.sent: List[tuple] = []
+        self._random = random.Random(seed)
+        self._forms = 0
+        self._open_forms = set()
+
+    async def start(self) -> None:
+        self.is_connected = True
+
+    async def stop(self) -> None:
+        self.is_connected = False
+
+    async def invoke(self, query):
+        handlers = {
+            raw.functions.payments.GetStarGifts: self._get_star_gifts,
+            raw.functions.payments.GetPaymentForm: self._get_payment_form,
+            raw.functions.payments.SendStarsForm: self._send_stars_form,
+        }
+        await self._call(type(query).__name__)
+        return await handlers[type(query)](query)
+
+    async def resolve_peer(self, chat_id: Union[int, str]) -> SimpleNamespace:
+        return SimpleNamespace(chat_id=chat_id)
+
+    async def _get_star_gifts(self, query) -> Union[raw.types.payments.StarGifts,
+                                                    raw.types.payments.StarGiftsNotModified]:
+        if query.hash == self.catalog.catalog_hash:
+            return raw.types.payments.StarGiftsNotModified()
+        return raw.types.payments.StarGifts(hash=self.catalog.catalog_hash, gifts=self.catalog.star_gifts(),
+                                            chats=[], users=[])
+
+    async def _get_payment_form(self, query) -> SimpleNamespace:
+        self.raw_payments or self._raise('FORM_UNSUPPORTED')
+        self._forms += 1
+        self._open_forms.add(self._forms)
+        return SimpleNamespace(form_id=self._forms)
+
+    async def _send_stars_form(self, query) -> None:
+        query.form_id in self._open_forms or self._raise('FORM_EXPIRED')
+        self._open_forms.discard(query.form_id)
+        self._purchase(query.invoice.peer.chat_id, query.invoice.gift_id)
+
+    async def send_gift(self, chat_id: Union[int, str], gift_id: int, **kwargs) -> None:
+        await self._call('send_gift')
+        await self._call('send_gift:form')
+        self._purchase(chat_id, gift_id)
+
+    def _purchase(self, chat_id: Union[int, str], gift_id: int) -> None:
+        price = self.catalog.gifts.get(gift_id, {}).get('price', 0)
+
+        if self._random.random() < self.flood_wait_rate:
+            raise FloodWait(value=self.flood_wait_seconds)
+        if price > self.balance or self._random.random() < self.balance_error_rate:
+            raise rpc_error('BALANCE_TOO_LOW')
+        if not self.catalog.take(gift_id):
+            raise rpc_error('STARGIFT_USAGE_LIMITED')
+
+        self.balance -= price
+        self.sent.append((time.monotonic(), chat_id, gift_id))
+
+    async def get_chat(self, chat_id: Union[int, str]) -> SimpleNamespace:
+        await self._call('get_chat')
+        return SimpleNamespace(id=chat_id, username=chat_id if isinstance(chat_id, str) else None)
+
+    async def get_stars_balance(self) -> int:
+        await self._call('get_stars_balance')
+        return self.balance
+
+    async def send_message(self, chat_id: Union[int, str], text: str, **kwargs) -> None:
+        await self._call('send_message')
+
+    @staticmethod
+    def _raise(error_id: str) -> None:
+        raise rpc_error(error_id)
+
+    async def _call(self, method: str) -> None:
+        self.rpc_counts[method] += 1
+        delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+        await asyncio.sleep(max(delay, 0.0))
@@ -0,0 +1,140 @@
+"""Offline replay of saved catalog snapshots through the decision path, with no network involved.
+
+Each snapshot is a history.json file (the legacy Pyrogram dump or the current GiftRecord list).
+The first snapshot seeds the known catalog. Every later one goes through CatalogState.diff,
+GiftDetector.prioritize_gifts and GiftProcessor.evaluate_gift, which calls Config.get_matching_range.
+Run from the project root:
+
+    python -m benchmarks.replay snapshots/ --ranges "1-1000: 100000 x 2: @bob" --low-supply
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from data.config import config
+
+
+class CatalogReplay:
+    @staticmethod
+    def parse_args() -> argparse.Namespace:
+        parser = argparse.ArgumentParser(description="Replay saved catalog snapshots through the decision path.")
+        parser.add_argument('snapshots', nargs='+', type=Path, help="history.json files or directories of them")
+        parser.add_argument('--ranges', help="GIFT_RANGES override, same syntax as config.ini")
+        parser.add_argument('--priority-keys', help="PRIORITY_KEYS override")
+        parser.add_argument('--low-supply', action=argparse.BooleanOptionalAction, default=None,
+                            help="PRIORITIZE_LOW_SUPPLY override")
+        parser.add_argument('--upgradable-only', action=argparse.BooleanOptionalAction, default=None,
+                            help="PURCHASE_ONLY_UPGRADABLE_GIFTS override")
+        parser.add_argument('--from-empty', action='store_true', help="treat the first snapshot as new gifts too")
+        parser.add_argument('--repeat', type=int, default=1, help="replay the sequence this many times for timing")
+        parser.add_argument('--json', action='store_true', help="print decisions as JSON lines")
+        return parser.parse_args()
+
+    @staticmethod
+    def configure(args: argparse.Namespace) -> None:
+        overrides = {
+            'GIFT_RANGES': args.ranges,
+            'PRIORITY_KEYS': args.priority_keys,
+            'PRIORITIZE_LOW_SUPPLY': None if args.low_supply is None else str(args.low_supply),
+            'PURCHASE_ONLY_UPGRADABLE_GIFTS': None if args.upgradable_only is None else str(args.upgradable_only)
+        }
+
+        for option, value in overrides.items():
+            value is not None and config.parser.set('Gifts', option, value)
+
+        config.GIFT_RANGES = config._parse_gift_ranges()
+        config.PURCHASE_ONLY_UPGRADABLE_GIFTS = config.parser.getboolean('Gifts', 'PURCHASE_ONLY_UPGRADABLE_GIFTS',
+                                                                         fallback=False)
+        config.PRIORITIZE_LOW_SUPPLY = config.parser.getboolean('Gifts', 'PRIORITIZE_LOW_SUPPLY', fallback=False)
+        config.PRIORITY_KEYS = config._parse_priority_keys()
+
+    @staticmethod
+    def load_snapshot(path: Path):
+        from app.core.simulation import RecordedCatalog
+
+        gifts = RecordedCatalog.load(path)
+        return {gift.id: gift for gift in gifts}, [gift.id for gift in gifts]
+
+    @staticmethod
+    async def replay(snapshots: List[Tuple[Path, dict, list]], from_empty: bool) -> List[dict]:
+        from app.core.callbacks import GiftProcessor
+        from app.utils.detector import CatalogState, GiftDetector, MemoryHistoryStore
+
+        seed = {} if from_empty else {gift_id: gift.content_hash for gift_id, gift in snapshots[0][1].items()}
+        state = CatalogState(MemoryHistoryStore(seed))
+        results = []
+
+        for path, current_gifts, gift_ids in snapshots[0 if from_empty else 1:]:
+            started = time.perf_counter()
+            new_gifts = await state.diff(current_gifts)
+            decisions = [
+                (gift, *await GiftProcessor.evaluate_gift(gift))
+                for _, gift in GiftDetector.prioritize_gifts(new_gifts, gift_ids)
+            ]
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            results.append({'snapshot': path.name, 'elapsed_ms': elapsed_ms, 'decisions': decisions})
+
+        await state.flush()
+        return results
+
+    @staticmethod
+    def describe(gift, is_eligible: bool, data: dict) -> dict:
+        decision = {'gift_id': gift.id, 'price': gift.price, 'total_amount': gift.total_amount}
+        decision.update(
+            {'action': 'buy', 'quantity': data['quantity'], 'recipients': data['recipients']} if is_eligible else
+            {'action': 'skip', 'reason': data.get('exclusion_reason') or 'no_matching_range'}
+        )
+        return decision
+
+    @staticmethod
+    def report(results: List[dict], timings: List[List[float]], as_json: bool) -> None:
+        for index, result in enumerate(results):
+            elapsed = [run[index] for run in timings]
+            decisions = [CatalogReplay.describe(*decision) for decision in result['decisions']]
+
+            if as_json:
+                print(json.dumps({'snapshot': result['snapshot'], 'best_ms': round(min(elapsed), 3),
+                                  'decisions': decisions}, ensure_ascii=False))
+                continue
+
+            print(f"{result['snapshot']}: {len(decisions)} new gifts, "
+                  f"best {min(elapsed):.3f}ms, mean {sum(elapsed) / len(elapsed):.3f}ms")
+            for decision in decisions:
+                outcome = (f"buy {decision['quantity']} x {', '.join(map(str, decision['recipients'])) or '-'}"
+                           if decision['action'] == 'buy' else f"skip ({decision['reason']})")
+                print(f"  {decision['gift_id']}: price={decision['price']} "
+                      f"supply={decision['total_amount']} -> {outcome}")
+
+        as_json or print(f"total: {sum(len(result['decisions']) for result in results)} decisions, "
+                         f"{sum(sum(run) for run in timings) / len(timings):.3f}ms per replay")
+
+    @staticmethod
+    async def run(args: argparse.Namespace) -> Optional[int]:
+        from app.core.simulation import RecordedCatalog
+
+        paths = RecordedCatalog.collect(args.snapshots)
+        if len(paths) < (1 if args.from_empty else 2):
+            print("Need at least two snapshots (or one with --from-empty).")
+            return 1
+
+        snapshots = [(path, *CatalogReplay.load_snapshot(path)) for path in paths]
+        timings, results = [], []
+
+        for _ in range(max(1, args.repeat)):
+            results = await CatalogReplay.replay(snapshots, args.from_empty)
+            timings.append([result['elapsed_ms'] for result in results])
+
+        CatalogReplay.report(results, timings, args.json)
+        return None
+
+    @staticmethod
+    def main() -> None:
+        args = CatalogReplay.parse_args()
+        CatalogReplay.configure(args)
+        raise SystemExit(asyncio.run(CatalogReplay.run(args)))
+
+
+CatalogReplay.main() if __name__ == "__main__" else None
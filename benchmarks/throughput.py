@@ -0,0 +1,163 @@
+"""End-to-end throughput benchmark: gift_monitoring and process_gifts driven against FakeClient.
+
+Run from the project root (config.ini is still read for API/language settings):
+
+    python -m benchmarks.throughput --drops 3 --drop-size 5 --supply 20 --recipients 3 --latency 0.05
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List
+
+from data.config import GiftRangeIndex, config
+
+
+class ThroughputBenchmark:
+    @staticmethod
+    def parse_args() -> argparse.Namespace:
+        parser = argparse.ArgumentParser(description="Drive the buyer against an in-process fake Telegram client.")
+        parser.add_argument('--catalog-size', type=int, default=100, help="gifts already in the catalog")
+        parser.add_argument('--drops', type=int, default=3, help="number of drops to simulate")
+        parser.add_argument('--drop-size', type=int, default=5, help="new gifts per drop")
+        parser.add_argument('--price', type=int, default=25, help="price of every dropped gift")
+        parser.add_argument('--supply', type=int, default=20, help="supply of every dropped gift (0 = unlimited)")
+        parser.add_argument('--quantity', type=int, default=2, help="units bought per recipient")
+        parser.add_argument('--recipients', type=int, default=3, help="number of recipients")
+        parser.add_argument('--balance', type=int, default=100_000, help="stars per purchasing account")
+        parser.add_argument('--accounts', type=int, default=1, help="purchasing accounts, including the primary")
+        parser.add_argument('--watchers', type=int, default=0, help="extra watcher sessions")
+        parser.add_argument('--latency', type=float, default=0.05, help="seconds per fake RPC")
+        parser.add_argument('--jitter', type=float, default=0.0, help="+/- seconds added to every RPC")
+        parser.add_argument('--flood-wait-rate', type=float, default=0.0, help="chance a send_gift raises FloodWait")
+        parser.add_argument('--flood-wait-seconds', type=int, default=1)
+        parser.add_argument('--balance-error-rate', type=float, default=0.0,
+                            help="chance a send_gift raises BALANCE_TOO_LOW")
+        parser.add_argument('--no-raw-payments', action='store_true',
+                            help="make the fake lack SendStarsForm so every unit goes through send_gift")
+        parser.add_argument('--interval', type=float, default=0.5, help="poll interval in seconds")
+        parser.add_argument('--concurrency', type=int, default=config.MAX_CONCURRENT_PURCHASES)
+        parser.add_argument('--settle', type=float, default=1.0, help="quiet seconds that end a drop")
+        parser.add_argument('--timeout', type=float, default=30.0, help="longest a single drop may run")
+        parser.add_argument('--seed', type=int, default=None)
+        return parser.parse_args()
+
+    @staticmethod
+    def configure(args: argparse.Namespace, workdir: Path) -> None:
+        recipients = list(range(1, args.recipients + 1))
+        ranges = [{'min_price': 0, 'max_price': 10 ** 9, 'supply_limit': 10 ** 9,
+                   'quantity': args.quantity, 'recipients': recipients}]
+
+        config.GIFT_RANGES = ranges
+        config.GIFT_RANGE_INDEX = GiftRangeIndex(ranges)
+        config.PURCHASE_ONLY_UPGRADABLE_GIFTS = False
+        config.CHANNEL_ID = None
+        config.INTERVAL = config.MIN_POLL_INTERVAL = config.MAX_POLL_INTERVAL = args.interval
+        config.POLL_JITTER = 0.0
+        config.DROP_WINDOWS = []
+        config.MAX_CONCURRENT_PURCHASES = max(1, args.concurrency)
+        config.HISTORY_BACKEND = 'json'
+        config.DATA_FILEPATH = workdir / "history.json"
+        config.JOURNAL_FILEPATH = workdir / "journal.jsonl"
+        config.TRACING = False
+        config.NOTIFICATION_INTERVAL = 0.0
+
+    @staticmethod
+    async def run(args: argparse.Namespace) -> None:
+        from app.core.callbacks import process_gifts
+        from app.core.limiter import rate_limited
+        from app.core.pool import purchase_pool
+        from app.notifications import notification_dispatcher
+        from app.utils.detector import GiftRecord, create_history_store, gift_monitoring
+        from benchmarks.fake_client import FakeCatalog, FakeClient
+
+        catalog = FakeCatalog(args.catalog_size)
+        client_options = dict(latency=args.latency, jitter=args.jitter, seed=args.seed)
+        buyer_options = dict(client_options, balance=args.balance, flood_wait_rate=args.flood_wait_rate,
+                             flood_wait_seconds=args.flood_wait_seconds, balance_error_rate=args.balance_error_rate,
+                             raw_payments=not args.no_raw_payments)
+
+        primary = rate_limited(FakeClient(catalog, "primary", **buyer_options))
+        purchasers = [rate_limited(FakeClient(catalog, f"purchaser{i}", **buyer_options))
+                      for i in range(1, args.accounts)]
+        watchers = [rate_limited(FakeClient(catalog, f"watcher{i}", **client_options))
+                    for i in range(1, args.watchers + 1)]
+        clients = [primary, *purchasers, *watchers]
+        buyers = [primary, *purchasers]
+
+        existing = {gift.id: GiftRecord.from_star_gift(gift) for gift in catalog.star_gifts()}
+        create_history_store().save(existing, {}, set())
+
+        purchase_pool.register(*buyers)
+        await purchase_pool.prepare(primary)
+        monitor = asyncio.create_task(gift_monitoring(primary, process_gifts, watchers))
+        await asyncio.sleep(args.interval * 2)
+
+        results = []
+        try:
+            for drop in range(1, args.drops + 1):
+                results.append(await ThroughputBenchmark._run_drop(args, drop, catalog, clients, buyers))
+        finally:
+            monitor.cancel()
+            await asyncio.gather(monitor, return_exceptions=True)
+            await notification_dispatcher.close()
+
+        ThroughputBenchmark.report(results)
+
+    @staticmethod
+    async def _run_drop(args: argparse.Namespace, drop: int, catalog, clients: List, buyers: List) -> dict:
+        rpc_before = sum((client.rpc_counts for client in clients), Counter())
+        sent_before = sum(len(client.sent) for client in buyers)
+
+        started = time.monotonic()
+        catalog.add_gifts(args.drop_size, args.price, args.supply)
+
+        sent = []
+        last_change = started
+        while time.monotonic() - started < args.timeout:
+            await asyncio.sleep(0.05)
+            current = sorted(entry for client in buyers for entry in client.sent)[sent_before:]
+            len(current) != len(sent) and (last_change := time.monotonic())
+            sent = current
+            if sent and time.monotonic() - last_change >= args.settle:
+                break
+
+        rpc_counts = sum((client.rpc_counts for client in clients), Counter()) - rpc_before
+        first_at = sent[0][0] if sent else None
+        duration = sent[-1][0] - first_at if len(sent) > 1 else 0.0
+
+        return {
+            'drop': drop,
+            'purchases': len(sent),
+            'first_purchase': first_at - started if sent else None,
+            'purchases_per_second': (len(sent) - 1) / duration if duration else None,
+            'rpc_counts': dict(rpc_counts)
+        }
+
+    @staticmethod
+    def report(results: List[dict]) -> None:
+        print()
+        for result in results:
+            first = result['first_purchase']
+            rate = result['purchases_per_second']
+            calls = ', '.join(f'{method}={count}' for method, count in sorted(result['rpc_counts'].items()))
+            print(f"drop {result['drop']}: {result['purchases']} purchases, "
+                  f"first after {f'{first * 1000:.0f}ms' if first is not None else '-'}, "
+                  f"{f'{rate:.1f}/s' if rate else '-'} | RPCs: {calls or '-'}")
+
+        firsts = sorted(r['first_purchase'] for r in results if r['first_purchase'] is not None)
+        total = sum(r['purchases'] for r in results)
+        median = f'{firsts[len(firsts) // 2] * 1000:.0f}ms' if firsts else '-'
+        print(f"total: {total} purchases over {len(results)} drops, median time-to-first-purchase {median}")
+
+    @staticmethod
+    def main() -> None:
+        args = ThroughputBenchmark.parse_args()
+        with tempfile.TemporaryDirectory() as workdir:
+            ThroughputBenchmark.configure(args, Path(workdir))
+            asyncio.run(ThroughputBenchmark.run(args))
+
+
+ThroughputBenchmark.main() if __name__ == "__main__" else None
@@ -1,11 +1,69 @@
 import configparser
 import sys
+from bisect import bisect_left, bisect_right
 from pathlib import Path
-from typing import List, Union, Dict, Any
+from typing import List, Optional, Tuple, Union, Dict, Any, Callable
 
 from app.utils.localization import localization
 from app.utils.logger import error
 
+DEFAULT_RATE_LIMITS = {
+    'send_gift': 10.0,
+    'GetPaymentForm': 10.0,
+    'SendStarsForm': 10.0,
+    'get_chat': 5.0,
+    'send_message': 1.0,
+    'get_stars_balance': 1.0,
+    'GetStarGifts': 2.0,
+}
+
+PRIORITY_KEYS: Dict[str, Callable[[Any], float]] = {
+    'low_supply': lambda gift: gift.total_amount if gift.is_limited else float('inf'),
+    'cheapest': lambda gift: gift.price,
+    'upgrade_value': lambda gift: -(gift.upgrade_price or 0)
+}
+
+
+class GiftRangeIndex:
+    """Precompiled GIFT_RANGES: bisect the price segment, then bisect its supply thresholds.
+
+    Each elementary price segment keeps only the ranges whose supply limit exceeds every earlier
+    range covering it, so the first threshold that fits is also the first matching range.
+    """
+
+    def __init__(self, ranges: List[Dict[str, Any]]) -> None:
+        self._bounds = sorted({r['min_price'] for r in ranges} | {r['max_price'] + 1 for r in ranges})
+        self._segments = [self._build_segment(ranges, price) for price in self._bounds]
+
+    @staticmethod
+    def _build_segment(ranges: List[Dict[str, Any]], price: int) -> Tuple[List[int], List[tuple]]:
+        limits, entries = [], []
+
+        for position, range_config in enumerate(ranges):
+            covers_price = range_config['min_price'] <= price <= range_config['max_price']
+            if covers_price and (not limits or range_config['supply_limit'] > limits[-1]):
+                limits.append(range_config['supply_limit'])
+                entries.append((range_config['quantity'], range_config['recipients'], position))
+
+        return limits, entries
+
+    def find(self, price: int, total_amount: int) -> Optional[Tuple[int, List[Union[int, str]]]]:
+        entry = self._find_entry(price, total_amount)
+        return entry[:2] if entry else None
+
+    def position(self, price: int, total_amount: int) -> Optional[int]:
+        entry = self._find_entry(price, total_amount)
+        return entry[2] if entry else None
+
+    def _find_entry(self, price: int, total_amount: int) -> Optional[tuple]:
+        segment = bisect_right(self._bounds, price) - 1
+        if segment < 0:
+            return None
+
+        limits, entries = self._segments[segment]
+        position = bisect_left(limits, total_amount)
+        return entries[position] if position < len(limits) else None
+
 
 class Config:
     def __init__(self):
@@ -25,20 +83,56 @@ class Config:
         base_dir = Path(__file__).parent
         self.SESSION = str(base_dir.parent / "data/account")
         self.DATA_FILEPATH = base_dir / "json/history.json"
+        self.HISTORY_DB_FILEPATH = base_dir / "json/history.db"
+        self.TRACE_FILEPATH = base_dir / "json/timeline.jsonl"
+        self.JOURNAL_FILEPATH = base_dir / "json/journal.jsonl"
 
     def _setup_properties(self) -> None:
         self.API_ID = self.parser.getint('Telegram', 'API_ID', fallback=0)
         self.API_HASH = self.parser.get('Telegram', 'API_HASH', fallback='')
         self.PHONE_NUMBER = self.parser.get('Telegram', 'PHONE_NUMBER', fallback='')
         self.CHANNEL_ID = self._parse_channel_id()
+        self.WATCHER_SESSIONS = self._parse_sessions('WATCHER_SESSIONS')
+        self.PURCHASE_SESSIONS = self._parse_sessions('PURCHASE_SESSIONS')
 
         self.INTERVAL = self.parser.getfloat('Bot', 'INTERVAL', fallback=15.0)
+        self.MIN_POLL_INTERVAL = self.parser.getfloat('Bot', 'MIN_POLL_INTERVAL', fallback=min(self.INTERVAL, 1.0))
+        self.MAX_POLL_INTERVAL = self.parser.getfloat('Bot', 'MAX_POLL_INTERVAL', fallback=self.INTERVAL * 4)
+        self.POLL_JITTER = min(max(self.parser.getfloat('Bot', 'POLL_JITTER', fallback=0.1), 0.0), 1.0)
+        self.DROP_WINDOWS = self._parse_drop_windows()
+        self.CHANGE_BOOST_DURATION = self.parser.getfloat('Bot', 'CHANGE_BOOST_DURATION', fallback=60.0)
+        self.IDLE_BACKOFF_AFTER = self.parser.getfloat('Bot', 'IDLE_BACKOFF_AFTER', fallback=900.0)
+        self.FLOOD_COOLDOWN = self.parser.getfloat('Bot', 'FLOOD_COOLDOWN', fallback=300.0)
+        self.CATALOG_CACHE_TTL = self.parser.getfloat('Bot', 'CATALOG_CACHE_TTL',
+                                                      fallback=max(self.INTERVAL * 2, 30.0))
         self.LANGUAGE = self.parser.get('Bot', 'LANGUAGE', fallback='EN').lower()
+        self.HISTORY_BACKEND = self.parser.get('Bot', 'HISTORY_BACKEND', fallback='sqlite').lower()
+        self.TRACING = self.parser.getboolean('Bot', 'TRACING', fallback=True)
+        self.PURCHASE_JOURNAL = self.parser.getboolean('Bot', 'PURCHASE_JOURNAL', fallback=True)
+        self.PURCHASE_WORKERS = max(1, self.parser.getint('Bot', 'PURCHASE_WORKERS', fallback=2))
+        self.BREAKER_COOLDOWN = self.parser.getfloat('Bot', 'BREAKER_COOLDOWN', fallback=60.0)
+        self.MAX_CONCURRENT_PURCHASES = max(1, self.parser.getint('Bot', 'MAX_CONCURRENT_PURCHASES', fallback=4))
+        self.BALANCE_RECONCILE_INTERVAL = self.parser.getfloat('Bot', 'BALANCE_RECONCILE_INTERVAL', fallback=60.0)
+        self.HOLD_SETTLE_DELAY = self.parser.getfloat('Bot', 'HOLD_SETTLE_DELAY', fallback=30.0)
+        self.RECIPIENT_CACHE_TTL = self.parser.getfloat('Bot', 'RECIPIENT_CACHE_TTL', fallback=3600.0)
+        self.RECIPIENT_CACHE_SIZE = max(1, self.parser.getint('Bot', 'RECIPIENT_CACHE_SIZE', fallback=256))
+        self.NOTIFICATION_INTERVAL = self.parser.getfloat('Bot', 'NOTIFICATION_INTERVAL', fallback=1.0)
+        self.NOTIFICATION_QUEUE_SIZE = max(1, self.parser.getint('Bot', 'NOTIFICATION_QUEUE_SIZE', fallback=1000))
+        self.NOTIFICATION_FLUSH_TIMEOUT = self.parser.getfloat('Bot', 'NOTIFICATION_FLUSH_TIMEOUT', fallback=10.0)
+        self.ACCOUNT_RATE_LIMIT = max(0.1, self.parser.getfloat('Bot', 'ACCOUNT_RATE_LIMIT', fallback=30.0))
+        self.RATE_LIMITS = self._parse_rate_limits()
 
         self.GIFT_RANGES = self._parse_gift_ranges()
         self.PURCHASE_ONLY_UPGRADABLE_GIFTS = self.parser.getboolean('Gifts', 'PURCHASE_ONLY_UPGRADABLE_GIFTS',
                                                                      fallback=False)
         self.PRIORITIZE_LOW_SUPPLY = self.parser.getboolean('Gifts', 'PRIORITIZE_LOW_SUPPLY', fallback=False)
+        self.PRIORITY_KEYS = self._parse_priority_keys()
+        self.PURCHASE_VALUE = self.parser.get('Gifts', 'PURCHASE_VALUE', fallback='scarcity').strip().lower()
+
+    def _parse_sessions(self, option: str) -> List[str]:
+        sessions_str = self.parser.get('Telegram', option, fallback='')
+        sessions_dir = Path(self.SESSION).parent
+        return [str(sessions_dir / name.strip()) for name in sessions_str.split(',') if name.strip()]
 
     def _parse_channel_id(self) -> Union[int, str, None]:
         channel_value = self.parser.get('Telegram', 'CHANNEL_ID', fallback='').strip()
@@ -59,6 +153,59 @@ class Config:
 
         return f"@{channel_value}"
 
+    def _parse_drop_windows(self) -> List[Tuple[int, int]]:
+        windows_str = self.parser.get('Bot', 'DROP_WINDOWS', fallback='')
+        windows = []
+
+        for window in windows_str.split(','):
+            window = window.strip()
+            window and windows.append(self._parse_drop_window(window))
+
+        return [w for w in windows if w]
+
+    @staticmethod
+    def _parse_drop_window(window: str) -> Optional[Tuple[int, int]]:
+        try:
+            (start_hours, start_minutes), (end_hours, end_minutes) = (
+                map(int, part.strip().split(':')) for part in window.split('-')
+            )
+        except ValueError:
+            error(f"Invalid drop window format (expected HH:MM-HH:MM in UTC): {window}")
+            return None
+
+        hours_valid = all(0 <= hours <= 23 for hours in (start_hours, end_hours))
+        if not hours_valid or not all(0 <= minutes <= 59 for minutes in (start_minutes, end_minutes)):
+            error(f"Invalid drop window time (hours 0-23, minutes 0-59): {window}")
+            return None
+
+        start, end = start_hours * 60 + start_minutes, end_hours * 60 + end_minutes
+        if start == end:
+            error(f"Empty drop window (start equals end): {window}")
+            return None
+        return start, end
+
+    def _parse_rate_limits(self) -> Dict[str, float]:
+        limits_str = self.parser.get('Bot', 'RATE_LIMITS', fallback='')
+        limits = dict(DEFAULT_RATE_LIMITS)
+
+        for limit in limits_str.split(','):
+            method, _, rate = limit.partition(':')
+            try:
+                method.strip() and limits.update({method.strip(): max(float(rate), 0.1)})
+            except ValueError:
+                error(f"Invalid rate limit format (expected method: requests per second): {limit.strip()}")
+
+        return limits
+
+    def _parse_priority_keys(self) -> List[str]:
+        keys_str = self.parser.get('Gifts', 'PRIORITY_KEYS', fallback='')
+        keys = [key.strip().lower() for key in keys_str.split(',') if key.strip()]
+
+        for key in keys:
+            key in PRIORITY_KEYS or error(f"Unknown priority key (expected one of {', '.join(PRIORITY_KEYS)}): {key}")
+        keys = [key for key in keys if key in PRIORITY_KEYS]
+        return ['low_supply', *keys] if self.PRIORITIZE_LOW_SUPPLY and 'low_supply' not in keys else keys
+
     def _parse_gift_ranges(self) -> List[Dict[str, Any]]:
         ranges_str = self.parser.get('Gifts', 'GIFT_RANGES', fallback='')
         ranges = []
@@ -67,7 +214,9 @@ class Config:
             range_item = range_item.strip()
             range_item and ranges.append(self._parse_single_range(range_item))
 
-        return [r for r in ranges if r]
+        ranges = [r for r in ranges if r]
+        self.GIFT_RANGE_INDEX = GiftRangeIndex(ranges)
+        return ranges
 
     def _parse_single_range(self, range_item: str) -> Dict[str, Any]:
         try:
@@ -132,14 +281,8 @@ class Config:
         return None
 
     def get_matching_range(self, price: int, total_amount: int) -> tuple[bool, int, List[Union[int, str]]]:
-        matching_ranges = [
-            (range_config['quantity'], range_config['recipients'])
-            for range_config in self.GIFT_RANGES
-            if (range_config['min_price'] <= price <= range_config['max_price'] and
-                total_amount <= range_config['supply_limit'])
-        ]
-
-        return (True, *matching_ranges[0]) if matching_ranges else (False, 0, [])
+        matching_range = self.GIFT_RANGE_INDEX.find(price, total_amount)
+        return (True, *matching_range) if matching_range else (False, 0, [])
 
     def _validate(self) -> None:
         validation_rules = {
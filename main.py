@@ -1,13 +1,20 @@
+import argparse
 import asyncio
 import traceback
+from contextlib import AsyncExitStack
+from pathlib import Path
 
 from pyrogram import Client
 
 from app.core.banner import display_title, get_app_info, set_window_title
-from app.core.callbacks import process_gift
-from app.notifications import send_start_message
+from app.core.callbacks import process_gifts, recover_purchases, resume_purchases
+from app.core.journal import purchase_journal
+from app.core.limiter import rate_limited
+from app.core.pool import purchase_pool
+from app.notifications import notification_dispatcher, send_start_message
 from app.utils.detector import gift_monitoring
 from app.utils.logger import info, error
+from app.utils.tracing import tracer
 from data.config import config, t, get_language_display
 
 app_info = get_app_info()
@@ -15,23 +22,80 @@ app_info = get_app_info()
 
 class Application:
     @staticmethod
-    async def run() -> None:
+    def parse_args() -> argparse.Namespace:
+        parser = argparse.ArgumentParser(description="Telegram star gift buyer.")
+        parser.add_argument('--simulate', action='store_true',
+                            help="dry run: real monitoring, evaluation and scheduling, stubbed sends")
+        parser.add_argument('--catalog', nargs='+', type=Path,
+                            help="with --simulate, poll these history.json snapshots (or directories) instead")
+        parser.add_argument('--step', type=float, default=config.INTERVAL,
+                            help="seconds between recorded snapshots")
+        parser.add_argument('--settle', type=float, default=10.0,
+                            help="seconds to keep running after the last recorded snapshot")
+        parser.add_argument('--from-empty', action='store_true',
+                            help="treat every gift in the first poll as new")
+        parser.add_argument('--balance', type=int, default=None,
+                            help="virtual stars per account (default: the account's real balance)")
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help="seconds each stubbed payment call takes")
+        return parser.parse_args()
+
+    @staticmethod
+    async def run(args: argparse.Namespace) -> None:
         set_window_title(app_info)
         display_title(app_info, get_language_display(config.LANGUAGE))
 
+        catalog, simulation = None, None
+        if args.simulate:
+            from app.core.simulation import RecordedCatalog, Simulation
+            catalog = args.catalog and RecordedCatalog(args.catalog, args.step) or None
+            simulation = Simulation(args.balance, args.latency, catalog)
+        simulated = simulation.wrap if simulation else lambda client, catalog=False: client
+
         async with Client(
                 name=config.SESSION,
                 api_id=config.API_ID,
                 api_hash=config.API_HASH,
-                phone_number=config.PHONE_NUMBER
-        ) as client:
-            await send_start_message(client)
-            await gift_monitoring(client, process_gift)
+                phone_number=config.PHONE_NUMBER,
+                sleep_threshold=0
+        ) as account, AsyncExitStack() as stack:
+            client = rate_limited(simulated(account, catalog=True))
+            watchers = [] if catalog else [
+                rate_limited(await stack.enter_async_context(
+                    Client(name=session, api_id=config.API_ID, api_hash=config.API_HASH, sleep_threshold=0)))
+                for session in config.WATCHER_SESSIONS
+            ]
+            purchasers = [
+                rate_limited(simulated(await stack.enter_async_context(
+                    Client(name=session, api_id=config.API_ID, api_hash=config.API_HASH, sleep_threshold=0))))
+                for session in config.PURCHASE_SESSIONS
+            ]
+            purchase_pool.register(client, *purchasers)
+            resuming = None
+
+            try:
+                simulation and await simulation.start()
+                await purchase_pool.prepare(client)
+                simulation or await send_start_message(client)
+                planned = await recover_purchases()
+
+                monitoring = asyncio.create_task(gift_monitoring(
+                    client, process_gifts, watchers, simulation and simulation.history_store(args.from_empty)))
+                resuming = planned and asyncio.create_task(resume_purchases(client, planned)) or None
+                await (asyncio.wait_for(monitoring, catalog.duration + args.settle) if catalog else monitoring)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                resuming and resuming.cancel()
+                simulation and simulation.report()
+                tracer.log_summary()
+                await purchase_journal.close()
+                await notification_dispatcher.close()
 
     @staticmethod
     def main() -> None:
         try:
-            asyncio.run(Application.run())
+            asyncio.run(Application.run(Application.parse_args()))
         except KeyboardInterrupt:
             info(t("console.terminated"))
         except Exception:
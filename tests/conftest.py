@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CONFIG = """
+[Telegram]
+API_ID = 1
+API_HASH = test
+PHONE_NUMBER = +10000000000
+
+[Bot]
+TRACING = False
+PURCHASE_JOURNAL = False
+
+[Gifts]
+GIFT_RANGES = 1-1000: 100000 x 1: 1
+"""
+
+# The top-level app.py would shadow the app/ package, and data.config reads config.ini from the working directory.
+sys.path.insert(0, str(ROOT))
+package = types.ModuleType('app')
+package.__path__ = [str(ROOT / 'app')]
+sys.modules['app'] = package
+
+with tempfile.TemporaryDirectory() as workdir:
+    Path(workdir, 'config.ini').write_text(CONFIG, encoding='utf-8')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import data.config  # noqa: F401
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from app.core.executor import CircuitBreakers, purchase_executor
+from app.core.pool import purchase_pool
+from app.purchase import buy_gift
+from app.utils.detector import GiftRecord
+from app.utils.helper import BalanceLedger, get_balance_ledger
+from benchmarks.fake_client import FakeCatalog, FakeClient
+from data.config import config
+
+
+@pytest.fixture(autouse=True)
+def isolated_pool(monkeypatch):
+    monkeypatch.setattr(purchase_executor, 'breakers', CircuitBreakers(config.BREAKER_COOLDOWN))
+    monkeypatch.setattr(purchase_pool, 'clients', [])
+    monkeypatch.setattr(purchase_pool, '_flood_until', {})
+    monkeypatch.setattr(purchase_pool, '_drained', {})
+    monkeypatch.setattr(BalanceLedger, '_ledgers', {})
+
+
+def buy_across(*accounts: FakeClient, units: int) -> None:
+    gift_id = accounts[0].catalog.add_gifts(1, 25)[0]
+    purchase_pool.register(*accounts)
+    asyncio.run(buy_gift(accounts[0], 'alice', GiftRecord(gift_id, 25, False, False, 0, None), units))
+
+
+def account(catalog: FakeCatalog, name: str, balance_error_rate: float = 0.0) -> FakeClient:
+    return FakeClient(catalog, name, balance=100, latency=0.0, balance_error_rate=balance_error_rate,
+                      raw_payments=False)
+
+
+def test_rejected_account_does_not_stop_healthy_ones():
+    catalog = FakeCatalog(size=0)
+    rejected, healthy = account(catalog, "rejected", balance_error_rate=1.0), account(catalog, "healthy")
+
+    buy_across(rejected, healthy, units=8)
+
+    assert len(rejected.sent) == 0
+    assert len(healthy.sent) == 4
+    assert not purchase_executor.breakers.is_open()
+
+
+def test_pool_breaker_trips_once_no_account_can_pay():
+    catalog = FakeCatalog(size=0)
+    first, second = account(catalog, "first", balance_error_rate=1.0), account(catalog, "second", 1.0)
+
+    buy_across(first, second, units=8)
+
+    assert first.sent == second.sent == []
+    assert purchase_executor.breakers.is_open()
+
+
+def test_drained_account_returns_once_a_balance_read_covers_the_price():
+    drained = account(FakeCatalog(size=0), "drained")
+    drained.balance = 30
+    purchase_pool.register(drained)
+
+    async def scenario():
+        ledger = get_balance_ledger(drained)
+        await ledger.refresh(drained)
+        purchase_pool.mark_drained(drained, 50)
+        before = purchase_pool.is_drained(drained, 50), purchase_pool.is_drained(drained, 25)
+
+        await ledger.refresh(drained)
+        short = purchase_pool.is_drained(drained, 50)
+        drained.balance = 80
+        await ledger.refresh(drained)
+        return before, short, purchase_pool.is_drained(drained, 50)
+
+    assert asyncio.run(scenario()) == ((True, False), True, False)
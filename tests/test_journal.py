@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+from app.core.journal import PurchaseJournal
+
+
+def write_lines(path, entries):
+    path.write_text("".join(json.dumps(entry) + "\n" for entry in entries) + "{truncated", encoding='utf-8')
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_recover_returns_planned_jobs_and_unconfirmed_starts(tmp_path):
+    journal = PurchaseJournal(tmp_path / 'journal.jsonl')
+    write_lines(journal.path, [
+        {'job': 'planned', 'op': 'plan', 'gift_id': 1, 'chat_id': 'alice'},
+        {'job': 'retried', 'op': 'plan', 'gift_id': 1, 'chat_id': 'alice'},
+        {'job': 'retried', 'op': 'start'},
+        {'job': 'retried', 'op': 'retry'},
+        {'job': 'started', 'op': 'plan', 'gift_id': 2, 'chat_id': 'bob'},
+        {'job': 'started', 'op': 'start'},
+        {'job': 'sent', 'op': 'plan', 'gift_id': 2, 'chat_id': 'bob'},
+        {'job': 'sent', 'op': 'start'},
+        {'job': 'sent', 'op': 'done'},
+        {'job': 'failed', 'op': 'plan', 'gift_id': 3, 'chat_id': 'bob'},
+        {'job': 'failed', 'op': 'fail', 'error': 'sold_out'},
+    ])
+
+    planned, unconfirmed = asyncio.run(journal.recover())
+
+    assert planned == {(1, 'alice'): ['planned', 'retried']}
+    assert [entry['job'] for entry in unconfirmed] == ['started']
+    assert [entry['job'] for entry in read_lines(journal.unconfirmed_path)] == ['started']
+    assert read_lines(journal.path) == [
+        {'job': 'planned', 'op': 'plan', 'gift_id': 1, 'chat_id': 'alice'},
+        {'job': 'retried', 'op': 'plan', 'gift_id': 1, 'chat_id': 'alice'},
+    ]
+
+
+def test_recorded_transitions_survive_recovery(tmp_path):
+    journal = PurchaseJournal(tmp_path / 'journal.jsonl')
+
+    async def scenario():
+        journal.record('a', 'plan', gift_id=1, chat_id=7)
+        journal.record('b', 'plan', gift_id=1, chat_id=7)
+        await journal.start('a')
+        journal.record('a', 'done')
+        await journal.close()
+        return await journal.recover()
+
+    planned, unconfirmed = asyncio.run(scenario())
+
+    assert planned == {(1, 7): ['b']}
+    assert unconfirmed == []
+
+
+def test_recover_without_a_journal_file(tmp_path):
+    assert asyncio.run(PurchaseJournal(tmp_path / 'journal.jsonl').recover()) == ({}, [])
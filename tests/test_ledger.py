@@ -0,0 +1,74 @@
+import asyncio
+
+from app.utils.helper import BalanceLedger
+from data.config import config
+
+
+class Account:
+    def __init__(self, balance: int) -> None:
+        self.name = "account"
+        self.balance = balance
+
+    async def get_stars_balance(self) -> int:
+        return self.balance
+
+
+async def hold_and_settle(balance_after: int):
+    account, ledger, outcomes = Account(100), BalanceLedger(), []
+    await ledger.refresh(account)
+    ledger.reserve(25, 2)
+    ledger.hold(account, 25, outcomes.append)
+    held_available = ledger.available
+
+    account.balance = balance_after
+    await asyncio.sleep(0.01)
+    await asyncio.sleep(0)
+    return ledger, outcomes, held_available
+
+
+def test_reserve_never_overcommits():
+    ledger = BalanceLedger()
+    ledger.balance = 100
+
+    assert ledger.reserve(30, 5) == 3
+    assert ledger.available == 10
+
+    ledger.debit(30)
+    ledger.release(30)
+    assert (ledger.balance, ledger.reserved, ledger.available) == (70, 30, 40)
+
+
+def test_hold_settles_as_sent_when_the_balance_dropped(monkeypatch):
+    monkeypatch.setattr(config, 'HOLD_SETTLE_DELAY', 0.0)
+
+    ledger, outcomes, held_available = asyncio.run(hold_and_settle(75))
+
+    assert held_available == 50
+    assert outcomes == [True]
+    assert (ledger.balance, ledger.held, ledger.available) == (75, 0, 50)
+
+
+def test_hold_settles_as_not_sent_when_the_balance_did_not_drop(monkeypatch):
+    monkeypatch.setattr(config, 'HOLD_SETTLE_DELAY', 0.0)
+
+    ledger, outcomes, _ = asyncio.run(hold_and_settle(100))
+
+    assert outcomes == [False]
+    assert (ledger.balance, ledger.held, ledger.available) == (100, 0, 75)
+
+
+def test_hold_stays_unsettled_before_the_settle_delay(monkeypatch):
+    monkeypatch.setattr(config, 'HOLD_SETTLE_DELAY', 60.0)
+
+    async def scenario():
+        account, ledger, outcomes = Account(100), BalanceLedger(), []
+        await ledger.refresh(account)
+        ledger.reserve(25, 1)
+        ledger.hold(account, 25, outcomes.append)
+        await ledger.refresh(account)
+        return ledger, outcomes
+
+    ledger, outcomes = asyncio.run(scenario())
+
+    assert outcomes == []
+    assert (ledger.held, ledger.available) == (25, 75)
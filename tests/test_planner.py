@@ -0,0 +1,37 @@
+from app.core.planner import budget_planner
+from app.utils.detector import GiftRecord
+
+
+def gift(gift_id: int, price: int, supply: int = 100) -> GiftRecord:
+    return GiftRecord(gift_id, price, True, False, supply, None)
+
+
+def test_plan_accepts_float_balance():
+    candidates = [(gift(1, 25), 2, [1, 2]), (gift(2, 40, supply=10), 1, [1])]
+
+    plan = budget_planner.plan(candidates, 100.0)
+
+    assert plan.spent <= 100
+    assert dict(plan.allocations)[gift(2, 40, supply=10)] == {1: 1}
+    assert plan.dropped
+
+
+def test_plan_keeps_everything_within_budget():
+    candidates = [(gift(1, 25), 2, [1, 2])]
+
+    plan = budget_planner.plan(candidates, 1000.0)
+
+    assert plan.spent == 100
+    assert plan.allocations == [(gift(1, 25), {1: 2, 2: 2})]
+    assert plan.dropped == []
+
+
+def test_plan_caps_units_at_remaining_supply():
+    scarce = gift(1, 25)._replace(availability_remains=3)
+    candidates = [(scarce, 2, [1, 2])]
+
+    plan = budget_planner.plan(candidates, 1000.0)
+
+    assert plan.spent == 75
+    assert plan.allocations == [(scarce, {1: 2, 2: 1})]
+    assert plan.dropped == []
@@ -0,0 +1,42 @@
+import random
+
+from data.config import GiftRangeIndex
+
+
+def linear_match(ranges, price, total_amount):
+    return next(((range_config['quantity'], range_config['recipients']) for range_config in ranges
+                 if range_config['min_price'] <= price <= range_config['max_price']
+                 and total_amount <= range_config['supply_limit']), None)
+
+
+def gift_range(min_price, max_price, supply_limit, quantity, recipients):
+    return {'min_price': min_price, 'max_price': max_price, 'supply_limit': supply_limit,
+            'quantity': quantity, 'recipients': recipients}
+
+
+def test_index_prefers_the_earliest_matching_range():
+    ranges = [gift_range(1, 100, 1000, 1, ['a']), gift_range(50, 200, 5000, 2, ['b']),
+              gift_range(1, 200, 500, 3, ['c'])]
+    index = GiftRangeIndex(ranges)
+
+    assert index.find(75, 800) == (1, ['a'])
+    assert index.find(75, 3000) == (2, ['b'])
+    assert index.find(150, 400) == (2, ['b'])
+    assert index.find(250, 10) is None
+    assert index.position(150, 400) == 1
+
+
+def test_index_matches_linear_first_match():
+    rng = random.Random(7)
+
+    for _ in range(50):
+        ranges = []
+        for position in range(rng.randint(1, 8)):
+            min_price = rng.randint(1, 500)
+            ranges.append(gift_range(min_price, min_price + rng.randint(0, 500), rng.randint(0, 10000),
+                                     rng.randint(1, 5), [position]))
+        index = GiftRangeIndex(ranges)
+
+        for _ in range(200):
+            price, total_amount = rng.randint(0, 1100), rng.randint(0, 11000)
+            assert index.find(price, total_amount) == linear_match(ranges, price, total_amount)